@@ -1,8 +1,9 @@
 from Team import Team
 import numpy as np
-from openskill import predict_win
+from WinProbability import getWinProbabilities
 from utils import *
 from Logger import Logger
+from RoundTrace import getRoundTrace
 
 class AlaraMatch:
     _teams: tuple[Team, Team, Team]
@@ -20,15 +21,15 @@ class AlaraMatch:
         self.cycleScore = [0,0,0]
         self.matchScore = [0,0,0]
         self.logger = logger
+        self._trace = getRoundTrace()
+        # number of the match in the trace of the simulation
+        self._traceMatch = self._trace.beginMatch() if self._trace is not None else None
 
     def playMatch(self):
-        MAX_CYCLE_SCORE= 2
-        MAX_MATCH_SCORE= 2
-
         defenderTeam = 0
 
-        self.logger.logInfoMessage(f"PLAYING MATCH N°{self.matchNumber} --------------------------------------------------")
-        odds = predict_win(teams=[[self._teams[0].get_rating()], [self._teams[1].get_rating()], [self._teams[2].get_rating()]])
+        self.logger.logInfoMessage("PLAYING MATCH N°%d --------------------------------------------------", self.matchNumber)
+        odds = getWinProbabilities(self._teams)
         self.logger.logWinningOdds(self._teams, odds)
 
         while MAX_MATCH_SCORE not in self.matchScore:
@@ -40,8 +41,9 @@ class AlaraMatch:
                 self._teams[winner_index].addRoundVictory()
                 defenderTeam = (defenderTeam + 1) % TEAMS_IN_ONE_MATCH
 
-                self.logger.logInfoMessage(f"State of current cycle")
-                self.logger.logInfoMessage(f"{self._teams[0].get_name()}/{self._teams[1].get_name()}/{self._teams[2].get_name()} -- {self.cycleScore[0]}/{self.cycleScore[1]}/{self.cycleScore[2]}")
+                if self.logger.isEnabled():
+                    self.logger.logInfoMessage("State of current cycle")
+                    self.logger.logInfoMessage("%s/%s/%s -- %d/%d/%d", self._teams[0].get_name(), self._teams[1].get_name(), self._teams[2].get_name(), *self.cycleScore)
             
             cycleWinnerIndex = self.cycleScore.index(MAX_CYCLE_SCORE)
             self.matchScore[cycleWinnerIndex] += 1
@@ -51,13 +53,14 @@ class AlaraMatch:
             self._teams[2].addCycle()
             self.cycleScore = [0,0,0]
 
-            self.logger.logInfoMessage(f"State of current match")
-            self.logger.logInfoMessage(f"{self._teams[0].get_name()}/{self._teams[1].get_name()}/{self._teams[2].get_name()} -- {self.matchScore[0]}/{self.matchScore[1]}/{self.matchScore[2]}")
+            if self.logger.isEnabled():
+                self.logger.logInfoMessage("State of current match")
+                self.logger.logInfoMessage("%s/%s/%s -- %d/%d/%d", self._teams[0].get_name(), self._teams[1].get_name(), self._teams[2].get_name(), *self.matchScore)
 
         matchWinnerIndex = self.matchScore.index(MAX_MATCH_SCORE)
         self._teams[matchWinnerIndex].addMatchVictory()
 
-        self.logger.logInfoMessage("\r\n" *3)
+        self.logger.logInfoMessage("\r\n\r\n\r\n")
 
         self._teams[0].addMatch()
         self._teams[1].addMatch()
@@ -71,7 +74,8 @@ class AlaraMatch:
         Takes the teams that are to play a match, and returns the winner
         """
         # win_p_t1 is the win probability of team_1
-        self.logger.logInfoMessage(f"ROUND:  {self._teams[0].get_name()} VS {self._teams[0].get_name()}  VS  {self._teams[0].get_name()} || Defending team: {self._teams[defender_index].get_name()}")
+        if self.logger.isEnabled():
+            self.logger.logInfoMessage("ROUND:  %s VS %s  VS  %s || Defending team: %s", self._teams[0].get_name(), self._teams[0].get_name(), self._teams[0].get_name(), self._teams[defender_index].get_name())
 
         self._teams[defender_index].addDefense()
 
@@ -80,7 +84,7 @@ class AlaraMatch:
         self._teams[2].addRound()
 
         # TODO mess around to represent the defending advantage and collaboration focus
-        win_p_t1, win_p_t2, win_p_t3 = predict_win(teams=[[self._teams[0].get_rating()], [self._teams[1].get_rating()], [self._teams[2].get_rating()]])
+        win_p_t1, win_p_t2, win_p_t3 = getWinProbabilities(self._teams)
 
         self.logger.logWinningOdds(self._teams, [win_p_t1, win_p_t2, win_p_t3])
 
@@ -92,7 +96,10 @@ class AlaraMatch:
         # If the random number is above win_p_t2 then team 3 wins
         bucket = np.where(u < win_p_t1, 0, np.where(u < win_p_t1 + win_p_t2, 1, 2)).astype(int)
 
-        self.logger.logInfoMessage("winner: " + str(self._teams[bucket]))
+        self.logger.logInfoMessage("winner: %s", self._teams[bucket])
+
+        if self._trace is not None:
+            self._trace.addRound(self._traceMatch, self.roundCount - 1, [team.get_id() for team in self._teams], defender_index, bucket, (win_p_t1, win_p_t2, win_p_t3))
 
         if(defender_index == bucket):
             self._teams[bucket].addDefenseVictory()  
@@ -0,0 +1,147 @@
+from Team import Team
+import numpy as np
+from WinProbability import getWinProbabilities
+from utils import *
+from AlaraMatchModel import AlaraMatchModel, sampleMatchBatch
+from RoundTrace import getRoundTrace
+
+
+def drawRoundWinners(win_probabilities: np.ndarray, rng_generator: np.random.Generator) -> np.ndarray:
+    """
+    Draws the winner of every possible round of a batch of matches in one go.
+
+    win_probabilities has shape (m, 3), the round win probability of each team of the m matches.
+    Returns an int array of shape (m, MAX_ROUNDS_IN_MATCH), rounds a match never reaches are simply ignored.
+    """
+    u = rng_generator.random((len(win_probabilities), MAX_ROUNDS_IN_MATCH))
+    # same thresholds as AlaraMatch._playRound: [0, p1) -> team 1, [p1, p1+p2) -> team 2, above -> team 3
+    first_threshold = win_probabilities[:, 0:1]
+    second_threshold = first_threshold + win_probabilities[:, 1:2]
+    return (u >= first_threshold).astype(np.int8) + (u >= second_threshold)
+
+
+def resolveMatchBatch(round_winners: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Runs the cycle/match state machine of AlaraMatch.playMatch on a batch of matches.
+
+    round_winners has shape (m, MAX_ROUNDS_IN_MATCH) and gives the index (0, 1 or 2) of the winner of each round.
+    Returns the match winner index (m,), the number of rounds played (m,) and the counters
+    of each team (m, 3, COUNTER_COUNT), ordered as the *_COUNTER columns of utils.
+    """
+    match_count = len(round_winners)
+    team_index = np.arange(TEAMS_IN_ONE_MATCH)
+    cycle_score = np.zeros((match_count, TEAMS_IN_ONE_MATCH), dtype=np.int8)
+    match_score = np.zeros((match_count, TEAMS_IN_ONE_MATCH), dtype=np.int8)
+    round_wins = np.zeros((match_count, TEAMS_IN_ONE_MATCH), dtype=np.int64)
+    defense_wins = np.zeros((match_count, TEAMS_IN_ONE_MATCH), dtype=np.int64)
+    round_counts = np.zeros(match_count, dtype=np.int64)
+    playing = np.ones(match_count, dtype=bool)
+
+    # every match moves forward together, finished matches are masked out instead of removed
+    for round_index in range(MAX_ROUNDS_IN_MATCH):
+        # the defender rotates every round and is not reset between cycles
+        defender = round_index % TEAMS_IN_ONE_MATCH
+        round_won = (round_winners[:, round_index, None] == team_index) & playing[:, None]
+
+        round_wins += round_won
+        defense_wins[:, defender] += round_won[:, defender]
+        cycle_score += round_won
+
+        # cycles reaching MAX_CYCLE_SCORE are won and the next one starts from 0/0/0
+        cycle_won = cycle_score == MAX_CYCLE_SCORE
+        match_score += cycle_won
+        cycle_score *= ~(cycle_won[:, 0:1] | cycle_won[:, 1:2] | cycle_won[:, 2:3])
+
+        # matches reaching MAX_MATCH_SCORE are over
+        match_over = playing & (match_score.max(axis=1) == MAX_MATCH_SCORE)
+        round_counts[match_over] = round_index + 1
+        playing &= ~match_over
+
+        if not playing.any():
+            break
+
+    match_winners = np.argmax(match_score == MAX_MATCH_SCORE, axis=1)
+
+    counters = np.zeros((match_count, TEAMS_IN_ONE_MATCH, COUNTER_COUNT), dtype=np.int64)
+    counters[np.arange(match_count), match_winners, MATCH_VICTORY_COUNTER] = 1
+    counters[:, :, CYCLE_VICTORY_COUNTER] = match_score
+    counters[:, :, ROUND_VICTORY_COUNTER] = round_wins
+    counters[:, :, DEFENSE_VICTORY_COUNTER] = defense_wins
+    counters[:, :, MATCH_COUNTER] = 1
+    counters[:, :, CYCLE_COUNTER] = match_score.sum(axis=1, keepdims=True)
+    counters[:, :, ROUND_COUNTER] = round_counts[:, None]
+    # team i defends rounds i, i+3, i+6... of the match
+    counters[:, :, DEFENSE_COUNTER] = (round_counts[:, None] - team_index + TEAMS_IN_ONE_MATCH - 1) // TEAMS_IN_ONE_MATCH
+
+    return match_winners, round_counts, counters
+
+
+def playMatchBatch(win_probabilities: np.ndarray, rng_generator: np.random.Generator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Simulates m three-team matches at once, see resolveMatchBatch for the returned arrays.
+    """
+    return resolveMatchBatch(drawRoundWinners(np.asarray(win_probabilities, dtype=np.float64), rng_generator))
+
+
+class AlaraMatchBatch:
+    """
+    Plays a list of independent matchups as array operations instead of one AlaraMatch per matchup.
+    Team counters end up the same as if every matchup had been played with AlaraMatch.playMatch.
+    """
+    _matchups: list[tuple[Team, Team, Team]]
+    _rng: np.random.Generator
+    _winProbabilities: np.ndarray
+
+    def __init__(self, matchups: list[tuple[Team, Team, Team]], rng_generator: np.random.Generator, win_probabilities: np.ndarray = None) -> None:
+        """
+        win_probabilities (m, 3) are the round odds of the matchups when they are already known (e.g. FieldWinProbabilities)
+        """
+        self._matchups = matchups
+        self._rng = rng_generator
+        self._winProbabilities = win_probabilities
+
+    def getWinProbabilities(self) -> np.ndarray:
+        if self._winProbabilities is not None:
+            return np.asarray(self._winProbabilities, dtype=np.float64)
+        # ratings are fixed during a match so the round odds are computed once per matchup
+        return np.array([getWinProbabilities(matchup) for matchup in self._matchups], dtype=np.float64)
+
+    def getExpectedRoundCount(self) -> float:
+        """
+        Exact expected number of rounds needed to play every matchup, e.g. to budget the length of an event.
+        """
+        if len(self._matchups) == 0:
+            return 0.0
+        return float(AlaraMatchModel(self.getWinProbabilities()).getExpectedRoundCount().sum())
+
+    def playMatches(self) -> list[Team]:
+        """
+        Plays every matchup, updates the team counters and returns the winner of each matchup.
+        """
+        if len(self._matchups) == 0:
+            return []
+
+        trace = getRoundTrace()
+        team_ids = np.array([[team.get_id() for team in matchup] for matchup in self._matchups], dtype=np.int64)
+        if MATCH_ENGINE == 2:
+            # the sampled outcome has no round sequence, nothing is traced
+            match_winners, _, counters = sampleMatchBatch(self.getWinProbabilities(), self._rng)
+        elif trace is not None:
+            # same draws as playMatchBatch, the round winners are kept for the trace
+            probabilities = self.getWinProbabilities()
+            round_winners = drawRoundWinners(probabilities, self._rng)
+            match_winners, round_counts, counters = resolveMatchBatch(round_winners)
+            trace.addTournamentMatches(team_ids, probabilities, round_winners, round_counts)
+        else:
+            match_winners, _, counters = playMatchBatch(self.getWinProbabilities(), self._rng)
+
+        table = self._matchups[0][0].get_table()
+        if all(team.get_table() is table for matchup in self._matchups for team in matchup):
+            # bulk update of the shared TeamTable
+            table.addCounters(team_ids.ravel(), counters.reshape(-1, COUNTER_COUNT))
+        else:
+            for matchup, matchup_counters in zip(self._matchups, counters):
+                for team, team_counters in zip(matchup, matchup_counters):
+                    team.addCounters(team_counters)
+
+        return [matchup[winner] for matchup, winner in zip(self._matchups, match_winners)]
@@ -0,0 +1,212 @@
+from collections import defaultdict
+from functools import lru_cache
+import numpy as np
+from utils import *
+
+# matches are processed by blocks so the (matches x outcome groups) matrices stay small
+MODEL_BLOCK_SIZE = 4096
+
+
+class _MatchOutcomeTable:
+    """
+    Every distinct outcome of an Alara match, solved once for all win probabilities.
+
+    Rounds are independent draws with fixed odds, so a path of rounds has probability p1^a * p2^b * p3^c
+    where a/b/c are the rounds won by each team. Paths are grouped into outcomes by the statistics they leave
+    on the teams (cycle wins, round wins, defense wins, length), and outcomes are grouped by their round wins:
+    all paths of a group have the same probability, so which outcome of a group happens does not depend on the odds.
+    """
+    # per outcome, sorted by group
+    winners: np.ndarray         # (k,)
+    roundCounts: np.ndarray     # (k,)
+    counters: np.ndarray        # (k, 3, COUNTER_COUNT)
+    searchKeys: np.ndarray      # (k,) group index + cumulative probability of the outcome inside its group
+    outcomeGroups: np.ndarray   # (k,) group of the outcome
+    conditionalProbabilities: np.ndarray  # (k,) probability of the outcome once its group is known
+    # per group of outcomes sharing the same round wins
+    roundWins: np.ndarray           # (g, 3)
+    pathCounts: np.ndarray          # (g,)
+    winnerDistribution: np.ndarray  # (g, 3)
+    roundCountDistribution: np.ndarray  # (g, MAX_ROUNDS_IN_MATCH + 1)
+    expectedCounters: np.ndarray    # (g, 3, COUNTER_COUNT)
+
+    def __init__(self) -> None:
+        # (cycle score, match score, round wins, defense wins) -> number of paths reaching that state
+        states = {((0, 0, 0), (0, 0, 0), (0, 0, 0), (0, 0, 0)): 1}
+        # (round wins, match score, defense wins, round count) -> number of paths ending the match that way
+        outcomes = defaultdict(int)
+
+        for round_index in range(MAX_ROUNDS_IN_MATCH):
+            defender = round_index % TEAMS_IN_ONE_MATCH
+            next_states = defaultdict(int)
+
+            for (cycle_score, match_score, round_wins, defense_wins), path_count in states.items():
+                for winner in range(TEAMS_IN_ONE_MATCH):
+                    new_cycle = list(cycle_score)
+                    new_match = list(match_score)
+                    new_rounds = list(round_wins)
+                    new_defenses = list(defense_wins)
+
+                    new_cycle[winner] += 1
+                    new_rounds[winner] += 1
+                    if winner == defender:
+                        new_defenses[winner] += 1
+
+                    if new_cycle[winner] == MAX_CYCLE_SCORE:
+                        new_match[winner] += 1
+                        new_cycle = [0, 0, 0]
+
+                    if new_match[winner] == MAX_MATCH_SCORE:
+                        outcomes[(tuple(new_rounds), tuple(new_match), tuple(new_defenses), round_index + 1)] += path_count
+                    else:
+                        next_states[(tuple(new_cycle), tuple(new_match), tuple(new_rounds), tuple(new_defenses))] += path_count
+
+            states = next_states
+
+        sorted_outcomes = sorted(outcomes.items())
+        group_keys = sorted({outcome[0] for outcome, _ in sorted_outcomes})
+        group_index = {key: g for g, key in enumerate(group_keys)}
+        outcome_count = len(sorted_outcomes)
+        group_count = len(group_keys)
+
+        self.winners = np.zeros(outcome_count, dtype=np.int64)
+        self.roundCounts = np.zeros(outcome_count, dtype=np.int64)
+        self.counters = np.zeros((outcome_count, TEAMS_IN_ONE_MATCH, COUNTER_COUNT), dtype=np.int64)
+        outcome_groups = np.zeros(outcome_count, dtype=np.int64)
+        outcome_path_counts = np.zeros(outcome_count, dtype=np.float64)
+
+        for k, ((rounds, match_score, defenses, round_count), path_count) in enumerate(sorted_outcomes):
+            winner = match_score.index(MAX_MATCH_SCORE)
+            self.winners[k] = winner
+            self.roundCounts[k] = round_count
+            outcome_groups[k] = group_index[rounds]
+            outcome_path_counts[k] = path_count
+
+            self.counters[k, winner, MATCH_VICTORY_COUNTER] = 1
+            self.counters[k, :, CYCLE_VICTORY_COUNTER] = match_score
+            self.counters[k, :, ROUND_VICTORY_COUNTER] = rounds
+            self.counters[k, :, DEFENSE_VICTORY_COUNTER] = defenses
+            self.counters[k, :, MATCH_COUNTER] = 1
+            self.counters[k, :, CYCLE_COUNTER] = sum(match_score)
+            self.counters[k, :, ROUND_COUNTER] = round_count
+            # team i defends rounds i, i+3, i+6... of the match
+            self.counters[k, :, DEFENSE_COUNTER] = [(round_count - i + TEAMS_IN_ONE_MATCH - 1) // TEAMS_IN_ONE_MATCH for i in range(TEAMS_IN_ONE_MATCH)]
+
+        self.roundWins = np.array(group_keys, dtype=np.int64)
+        self.pathCounts = np.bincount(outcome_groups, weights=outcome_path_counts, minlength=group_count)
+        # probability of each outcome once its group is known
+        conditional = outcome_path_counts / self.pathCounts[outcome_groups]
+        self.outcomeGroups = outcome_groups
+        self.conditionalProbabilities = conditional
+
+        self.winnerDistribution = np.zeros((group_count, TEAMS_IN_ONE_MATCH))
+        np.add.at(self.winnerDistribution, (outcome_groups, self.winners), conditional)
+        self.roundCountDistribution = np.zeros((group_count, MAX_ROUNDS_IN_MATCH + 1))
+        np.add.at(self.roundCountDistribution, (outcome_groups, self.roundCounts), conditional)
+        self.expectedCounters = np.zeros((group_count, TEAMS_IN_ONE_MATCH, COUNTER_COUNT))
+        np.add.at(self.expectedCounters, outcome_groups, conditional[:, None, None] * self.counters)
+
+        cumulative = np.cumsum(outcome_path_counts)
+        group_start = np.concatenate(([0.0], np.cumsum(self.pathCounts)[:-1]))
+        self.searchKeys = outcome_groups + (cumulative - group_start[outcome_groups]) / self.pathCounts[outcome_groups]
+        # the last outcome of each group must catch every draw that falls in it, whatever the rounding errors
+        group_ends = np.r_[outcome_groups[1:] != outcome_groups[:-1], True]
+        self.searchKeys[group_ends] = outcome_groups[group_ends] + 1
+
+
+@lru_cache(maxsize=None)
+def _getOutcomeTable() -> _MatchOutcomeTable:
+    return _MatchOutcomeTable()
+
+
+class AlaraMatchModel:
+    """
+    Exact outcome distribution of matches whose round win probabilities are known.
+    Works on a batch of m matches, win_probabilities having the shape (m, 3) (or (3,) for a single match).
+    """
+    _winProbabilities: np.ndarray
+
+    def __init__(self, win_probabilities: np.ndarray) -> None:
+        self._winProbabilities = np.atleast_2d(np.asarray(win_probabilities, dtype=np.float64))
+
+    def _groupProbabilityBlocks(self):
+        """
+        Yields (first match index, (block size, g) probabilities of each group of outcomes)
+        """
+        table = _getOutcomeTable()
+        log_path_counts = np.log(table.pathCounts)
+        # p1^a * p2^b * p3^c for every group as one matrix product in log space, odds of 0 are clipped to a negligible value
+        log_probabilities = np.log(np.maximum(self._winProbabilities, np.finfo(np.float64).tiny))
+        for start in range(0, len(log_probabilities), MODEL_BLOCK_SIZE):
+            block = log_probabilities[start:start + MODEL_BLOCK_SIZE]
+            yield start, np.exp(block @ table.roundWins.T + log_path_counts)
+
+    def _expectation(self, group_values: np.ndarray) -> np.ndarray:
+        result = np.zeros((len(self._winProbabilities),) + group_values.shape[1:])
+        for start, group_probabilities in self._groupProbabilityBlocks():
+            result[start:start + len(group_probabilities)] = np.tensordot(group_probabilities, group_values, axes=1)
+        return result
+
+    def getOutcomeProbabilities(self) -> np.ndarray:
+        """
+        (m, k) probability of every outcome of getMatchOutcomes
+        """
+        table = _getOutcomeTable()
+        result = np.zeros((len(self._winProbabilities), len(table.winners)))
+        for start, group_probabilities in self._groupProbabilityBlocks():
+            result[start:start + len(group_probabilities)] = group_probabilities[:, table.outcomeGroups] * table.conditionalProbabilities
+        return result
+
+    def getMatchWinProbabilities(self) -> np.ndarray:
+        return self._expectation(_getOutcomeTable().winnerDistribution)
+
+    def getRoundCountDistribution(self) -> np.ndarray:
+        """
+        (m, MAX_ROUNDS_IN_MATCH + 1) array, column r is the probability that the match lasts r rounds
+        """
+        return self._expectation(_getOutcomeTable().roundCountDistribution)
+
+    def getExpectedRoundCount(self) -> np.ndarray:
+        return self.getRoundCountDistribution() @ np.arange(MAX_ROUNDS_IN_MATCH + 1)
+
+    def getExpectedCounters(self) -> np.ndarray:
+        """
+        (m, 3, COUNTER_COUNT) array of the expected statistics of each team
+        """
+        return self._expectation(_getOutcomeTable().expectedCounters)
+
+    def getExpectedDefenseVictories(self) -> np.ndarray:
+        return self.getExpectedCounters()[:, :, DEFENSE_VICTORY_COUNTER]
+
+    def sampleMatches(self, rng_generator: np.random.Generator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Draws one complete outcome per match with two uniforms: one for the round wins, one for the outcome inside that group.
+        Returns the same arrays as AlaraMatchBatch.playMatchBatch: winner index, round count and counters.
+        """
+        table = _getOutcomeTable()
+        match_count = len(self._winProbabilities)
+        u = rng_generator.random((match_count, 2))
+        groups = np.zeros(match_count, dtype=np.int64)
+
+        for start, group_probabilities in self._groupProbabilityBlocks():
+            cumulative = np.cumsum(group_probabilities, axis=1)
+            block_u = u[start:start + len(cumulative), 0] * cumulative[:, -1]
+            groups[start:start + len(cumulative)] = np.minimum((cumulative <= block_u[:, None]).sum(axis=1), cumulative.shape[1] - 1)
+
+        outcome_index = np.searchsorted(table.searchKeys, groups + u[:, 1], side="right")
+        return table.winners[outcome_index], table.roundCounts[outcome_index], table.counters[outcome_index]
+
+
+def getMatchOutcomes() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Winner index (k,) and counters (k, 3, COUNTER_COUNT) of every distinct outcome of a match, see getOutcomeProbabilities
+    """
+    table = _getOutcomeTable()
+    return table.winners, table.counters
+
+
+def sampleMatchBatch(win_probabilities: np.ndarray, rng_generator: np.random.Generator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Counterpart of AlaraMatchBatch.playMatchBatch that samples whole matches from the exact model.
+    """
+    return AlaraMatchModel(win_probabilities).sampleMatches(rng_generator)
@@ -0,0 +1,110 @@
+import numpy as np
+from math import comb
+from utils import *
+from WinProbability import predictWinArray
+from AlaraMatchModel import AlaraMatchModel
+
+# triples evaluated at once, bounds the (triples x 3) rating arrays built for predictWinArray
+FIELD_BLOCK_SIZE = 1 << 18
+# match win probabilities are only read, never used as draw thresholds, single precision is enough
+MATCH_PROBABILITY_DTYPE = np.float32
+
+
+def getTripleCount(n: int) -> int:
+    return comb(n, TEAMS_IN_ONE_MATCH)
+
+
+def getTriples(n: int, start: int = 0, stop: int = None) -> np.ndarray:
+    """
+    (stop - start, 3) team indices i < j < k of the triples of ranks start to stop, triples being ranked in the
+    order of itertools.combinations(range(n), 3)
+    """
+    stop = getTripleCount(n) if stop is None else stop
+    # triples whose first team is i start at rank first_ranks[i]
+    first_ranks = np.array([getTripleCount(n) - getTripleCount(n - i) for i in range(n + 1)])
+    triples = np.zeros((max(stop - start, 0), TEAMS_IN_ONE_MATCH), dtype=np.int64)
+    for i in range(np.searchsorted(first_ranks, start, side="right") - 1, n - 2):
+        if first_ranks[i] >= stop:
+            break
+        # the pairs j < k of the teams after i, in combinations order
+        j, k = np.triu_indices(n - i - 1, 1)
+        lower, upper = max(start - first_ranks[i], 0), min(stop, first_ranks[i + 1]) - first_ranks[i]
+        block = slice(first_ranks[i] + lower - start, first_ranks[i] + upper - start)
+        triples[block, 0] = i
+        triples[block, 1] = j[lower:upper] + i + 1
+        triples[block, 2] = k[lower:upper] + i + 1
+    return triples
+
+
+def getTripleRanks(n: int, triples: np.ndarray) -> np.ndarray:
+    """
+    Rank of each triple (..., 3) of sorted team indices i < j < k, the inverse of getTriples
+    """
+    triples = np.asarray(triples, dtype=np.int64)
+    i, j, k = triples[..., 0], triples[..., 1], triples[..., 2]
+    # triples before (i, j, k): every triple starting below i, then below j after i, then below k after j
+    m = n - 1 - i
+    before_i = getTripleCount(n) - (n - i) * (n - i - 1) * (n - i - 2) // 6
+    before_j = m * (m - 1) // 2 - (n - j) * (n - j - 1) // 2
+    return before_i + before_j + k - j - 1
+
+
+class FieldWinProbabilities:
+    """
+    Round and match win probabilities of every possible matchup of a field of n teams of known ratings, evaluated
+    once for the C(n, 3) triples (in the order of itertools.combinations) and indexed by triple rank (getTripleRanks).
+    A round-robin plays every triple once and reads all its odds from here instead of one openskill call per matchup.
+
+    Round win probabilities are kept in double precision: they are the draw thresholds of the matches and the same
+    as openskill's predict_win, so the draws of a seeded run don't change. Match win probabilities are computed on
+    first use (AlaraMatchModel) and stored in MATCH_PROBABILITY_DTYPE.
+    """
+    _mus: np.ndarray
+    _sigmas: np.ndarray
+    _roundWinProbabilities: np.ndarray
+    _matchWinProbabilities: np.ndarray = None
+
+    def __init__(self, mus: np.ndarray, sigmas: np.ndarray) -> None:
+        """
+        mus and sigmas (n,) are the ratings of the teams of the field, the odds of triple (i, j, k) are in that order
+        """
+        self._mus = np.asarray(mus, dtype=np.float64)
+        self._sigmas = np.asarray(sigmas, dtype=np.float64)
+        n = len(self._mus)
+        triple_count = getTripleCount(n)
+
+        self._roundWinProbabilities = np.zeros((triple_count, TEAMS_IN_ONE_MATCH))
+        for start in range(0, triple_count, FIELD_BLOCK_SIZE):
+            triples = getTriples(n, start, min(start + FIELD_BLOCK_SIZE, triple_count))
+            self._roundWinProbabilities[start:start + len(triples)] = predictWinArray(self._mus[triples], self._sigmas[triples])
+
+    @classmethod
+    def fromTeams(cls, participants: list) -> "FieldWinProbabilities":
+        ratings = [team.get_rating() for team in participants]
+        return cls(np.array([rating.mu for rating in ratings]), np.array([rating.sigma for rating in ratings]))
+
+    def getTeamCount(self) -> int:
+        return len(self._mus)
+
+    def getTripleCount(self) -> int:
+        return len(self._roundWinProbabilities)
+
+    def getTriples(self) -> np.ndarray:
+        return getTriples(self.getTeamCount())
+
+    def getTripleRanks(self, triples: np.ndarray) -> np.ndarray:
+        return getTripleRanks(self.getTeamCount(), triples)
+
+    def getRoundWinProbabilities(self, ranks: np.ndarray = None) -> np.ndarray:
+        """
+        (m, 3) round win probabilities of the triples of ranks (of every triple when None)
+        """
+        return self._roundWinProbabilities if ranks is None else self._roundWinProbabilities[ranks]
+
+    def getMatchWinProbabilities(self, ranks: np.ndarray = None) -> np.ndarray:
+        """
+        (m, 3) match win probabilities of the triples of ranks (of every triple when None)
+        """
+        if self._matchWinProbabilities is None:
+            self._matchWinProbabilities = AlaraMatchModel(self._roundWinProbabilities).getMatchWinProbabilities().astype(MATCH_PROBABILITY_DTYPE)
+        return self._matchWinProbabilities if ranks is None else self._matchWinProbabilities[ranks]
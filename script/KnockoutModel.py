@@ -0,0 +1,247 @@
+import numpy as np
+from utils import *
+from Team import computeScores, rankOrderFromScores
+from WinProbability import predictWinArray
+from AlaraMatchModel import AlaraMatchModel, getMatchOutcomes
+
+# matchups evaluated at once, bounds the (matchups x outcome groups) matrices of AlaraMatchModel
+KNOCKOUT_MODEL_BLOCK_SIZE = 1 << 16
+
+
+class SingleKnockoutModel:
+    """
+    Analysis of a single knockout (TournamentSingleKnockout) between teams of known ratings, without playing it.
+    Reach probabilities, match victory distributions and pair orders on match victories are exact.
+
+    The bracket is fixed: teams 3i, 3i+1, 3i+2 of the participant order meet at level 0, then the winners of 3
+    consecutive matches meet at the next level. A team reaches level l + 1 when it reached level l and wins its match,
+    whose winner distribution is exact (AlaraMatchModel), so the reach probabilities follow level by level over every
+    possible matchup. Two teams stay in separate parts of the bracket, independent of each other, until the level where
+    they can meet, which gives the joint distribution of their match victories.
+
+    The final ranking orders teams by match victories, then by cycle, round and defense rates (then participant order).
+    Pairs tied on match victories are split this way:
+    - both lost their first match (about 9 tied pairs out of 10): their scores come from that match only, the exact
+      outcome distribution of the first matches (AlaraMatchModel.getOutcomeProbabilities) orders them exactly,
+      jointly when they lost the same match, independently otherwise
+    - both eliminated at a later level: their rates add up every round of several matches against random opponents and
+      are not modelled, every such pair is counted as discordant for one bound and concordant for the other.
+
+    The expected kendall tau distance is therefore only bounded (getKendallTauDistanceBounds,
+    getWeightedKendallTauDistanceBounds, getRankingProbabilityBounds per pair), and the bounds are wide: about 0.425 to
+    0.516 for 27 teams. The model doesn't replace the simulations of a knockout.
+    """
+    _mus: np.ndarray
+    _sigmas: np.ndarray
+    _levelCount: int
+
+    def __init__(self, mus: np.ndarray, sigmas: np.ndarray) -> None:
+        """
+        mus and sigmas (n,) are the ratings of the teams in participant order, n a power of 3
+        """
+        self._mus = np.asarray(mus, dtype=np.float64)
+        self._sigmas = np.asarray(sigmas, dtype=np.float64)
+        n = len(self._mus)
+        if n < TEAMS_IN_ONE_MATCH or not is_power_of(n, TEAMS_IN_ONE_MATCH):
+            raise Exception("Single knockout needs for base participants unfulfilled (need power of 3)")
+
+        self._levelCount = 0
+        while TEAMS_IN_ONE_MATCH ** self._levelCount < n:
+            self._levelCount += 1
+
+        # reach[l, i]: probability that team i wins its first l matches, the last row is the probability to win the knockout
+        self._reach = np.zeros((self._levelCount + 1, n))
+        self._reach[0] = 1
+        # level of the match where teams i and j can meet
+        self._meetingLevel = np.zeros((n, n), dtype=np.int64)
+        # probability that i wins / that the third team wins the match where i and j meet, given they both reached it
+        self._meetingWin = np.zeros((n, n))
+        self._meetingThirdWin = np.zeros((n, n))
+        for level in range(self._levelCount):
+            self._solveLevel(level)
+        self._solveFirstMatchTies()
+
+    @classmethod
+    def fromTeams(cls, participants: list) -> "SingleKnockoutModel":
+        ratings = [team.get_rating() for team in participants]
+        return cls(np.array([rating.mu for rating in ratings]), np.array([rating.sigma for rating in ratings]))
+
+    def _solveLevel(self, level: int):
+        """
+        Fills the meeting probabilities of the pairs meeting at level, then the reach probabilities of level + 1.
+        Every group of 3^(level + 1) teams plays one match at this level between the winners of its 3 parts.
+        """
+        n = len(self._mus)
+        size = TEAMS_IN_ONE_MATCH ** level
+        group_count = n // (size * TEAMS_IN_ONE_MATCH)
+        reach = self._reach[level]
+        # parts[k][g]: team ids of part k of group g, the winner of part k plays in position k
+        group_ids = np.arange(n).reshape(group_count, TEAMS_IN_ONE_MATCH, size)
+        parts = [group_ids[:, k] for k in range(TEAMS_IN_ONE_MATCH)]
+
+        # win_xy[k][..., a, b]: probability that position k wins when teams a and b of parts x and y are there,
+        # the team of the third part being weighted by its reach probability. win_01 and win_02 have one row per team of part 0.
+        win_01 = np.zeros((TEAMS_IN_ONE_MATCH, group_count * size, size))
+        win_02 = np.zeros((TEAMS_IN_ONE_MATCH, group_count * size, size))
+        win_12 = np.zeros((TEAMS_IN_ONE_MATCH, group_count, size, size))
+
+        first = parts[0].ravel()
+        first_group = np.repeat(np.arange(group_count), size)
+        block = max(1, KNOCKOUT_MODEL_BLOCK_SIZE // (size * size))
+        for start in range(0, len(first), block):
+            rows = slice(start, start + block)
+            groups = first_group[rows]
+            matchups = np.empty((len(groups), size, size, TEAMS_IN_ONE_MATCH), dtype=np.int64)
+            matchups[..., 0] = first[rows, None, None]
+            matchups[..., 1] = parts[1][groups][:, :, None]
+            matchups[..., 2] = parts[2][groups][:, None, :]
+            odds = predictWinArray(self._mus[matchups], self._sigmas[matchups])
+            winners = AlaraMatchModel(odds.reshape(-1, TEAMS_IN_ONE_MATCH)).getMatchWinProbabilities().reshape(odds.shape)
+
+            # the rows of a block are consecutive teams of part 0, sorted by group
+            group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+            for k in range(TEAMS_IN_ONE_MATCH):
+                win_01[k, rows] = np.einsum("rbc,rc->rb", winners[..., k], reach[parts[2][groups]])
+                win_02[k, rows] = np.einsum("rbc,rb->rc", winners[..., k], reach[parts[1][groups]])
+                weighted = winners[..., k] * reach[first[rows]][:, None, None]
+                win_12[k, groups[group_starts]] += np.add.reduceat(weighted, group_starts, axis=0)
+
+        for x, y, win, row_ids, column_ids in ((0, 1, win_01, first[:, None], parts[1][first_group]),
+                                               (0, 2, win_02, first[:, None], parts[2][first_group]),
+                                               (1, 2, win_12, parts[1][:, :, None], parts[2][:, None, :])):
+            third = TEAMS_IN_ONE_MATCH - x - y
+            self._meetingLevel[row_ids, column_ids] = self._meetingLevel[column_ids, row_ids] = level
+            self._meetingWin[row_ids, column_ids] = win[x]
+            self._meetingWin[column_ids, row_ids] = win[y]
+            self._meetingThirdWin[row_ids, column_ids] = self._meetingThirdWin[column_ids, row_ids] = win[third]
+
+        # a team of part k wins with the probability it has against the team of part k + 1 (weighted by its reach),
+        # which already sums over the last part
+        team_ids = np.arange(n)
+        partner_part = (team_ids // size + 1) % TEAMS_IN_ONE_MATCH
+        partners = (team_ids // (size * TEAMS_IN_ONE_MATCH) * TEAMS_IN_ONE_MATCH + partner_part)[:, None] * size + np.arange(size)
+        self._reach[level + 1] = reach * (self._meetingWin[team_ids[:, None], partners] * reach[partners]).sum(axis=1)
+
+    def _solveFirstMatchTies(self):
+        """
+        Fills firstLossAbove[i, j]: probability that teams i and j both lose their first match and i is ranked above j
+        """
+        n = len(self._mus)
+        winners, counters = getMatchOutcomes()
+        # rank of the score of every position of every outcome among all the scores a match can leave, best first
+        scores = computeScores(counters)
+        distinct_scores, score_index = np.unique(scores.reshape(-1, scores.shape[-1]), axis=0, return_inverse=True)
+        score_rank = np.empty(len(distinct_scores), dtype=np.int64)
+        score_rank[rankOrderFromScores(distinct_scores)] = np.arange(len(distinct_scores))
+        score_rank = score_rank[score_index.ravel()].reshape(winners.shape + (TEAMS_IN_ONE_MATCH,))
+
+        matchups = np.arange(n).reshape(-1, TEAMS_IN_ONE_MATCH)
+        outcomes = AlaraMatchModel(predictWinArray(self._mus[matchups], self._sigmas[matchups])).getOutcomeProbabilities()
+
+        # loss_scores[i, r]: probability that team i loses its first match with the score of rank r
+        loss_scores = np.zeros((n, len(distinct_scores)))
+        for position in range(TEAMS_IN_ONE_MATCH):
+            losing = np.flatnonzero(winners != position)
+            losing = losing[np.argsort(score_rank[losing, position], kind="stable")]
+            ranks = score_rank[losing, position]
+            starts = np.flatnonzero(np.r_[True, ranks[1:] != ranks[:-1]])
+            loss_scores[np.ix_(matchups[:, position], ranks[starts])] = np.add.reduceat(outcomes[:, losing], starts, axis=1)
+
+        # teams of different first matches are independent, on equal scores the first participant is ranked first
+        worse = np.cumsum(loss_scores[:, ::-1], axis=1)[:, ::-1] - loss_scores
+        self._firstLossAbove = loss_scores @ worse.T + np.triu(loss_scores @ loss_scores.T, 1)
+
+        # teams of the same first match lose it together when the third one wins it
+        for x in range(TEAMS_IN_ONE_MATCH):
+            for y in range(x + 1, TEAMS_IN_ONE_MATCH):
+                third_wins = winners == TEAMS_IN_ONE_MATCH - x - y
+                x_above = third_wins & (score_rank[:, x] <= score_rank[:, y])
+                self._firstLossAbove[matchups[:, x], matchups[:, y]] = outcomes[:, x_above].sum(axis=1)
+                self._firstLossAbove[matchups[:, y], matchups[:, x]] = outcomes[:, third_wins & ~x_above].sum(axis=1)
+        np.fill_diagonal(self._firstLossAbove, 0)
+
+    def getLevelCount(self) -> int:
+        return self._levelCount
+
+    def getReachProbabilities(self) -> np.ndarray:
+        """
+        (levels + 1, n) array, row l is the probability of each team to win at least l matches (to play at level l),
+        the last row is the probability to win the knockout
+        """
+        return self._reach
+
+    def getWinProbabilities(self) -> np.ndarray:
+        return self._reach[-1]
+
+    def getMatchVictoryDistribution(self) -> np.ndarray:
+        """
+        (n, levels + 1) array, column w is the probability of each team to end the knockout with w match victories
+        """
+        return (self._reach - np.r_[self._reach[1:], np.zeros((1, len(self._mus)))]).T
+
+    def getPairwiseProbabilities(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (n, n) arrays: probability that team i ends with more match victories than team j, and that they end with as many
+        """
+        n = len(self._mus)
+        eliminated = self.getMatchVictoryDistribution().T
+        above = np.zeros((n, n))
+        tied = np.zeros((n, n))
+        # below their meeting level, i and j are in separate parts of the bracket and independent
+        for level in range(self._levelCount):
+            before_meeting = self._meetingLevel > level
+            above += before_meeting * np.outer(self._reach[level + 1], eliminated[level])
+            tied += before_meeting * np.outer(eliminated[level], eliminated[level])
+
+        # both reached their meeting match: the winner goes above the other, or both lose it to the third team
+        team_ids = np.arange(n)
+        both_meet = self._reach[self._meetingLevel, team_ids[:, None]] * self._reach[self._meetingLevel, team_ids[None, :]]
+        above += both_meet * self._meetingWin
+        tied += both_meet * self._meetingThirdWin
+        np.fill_diagonal(above, 0)
+        np.fill_diagonal(tied, 0)
+        return above, tied
+
+    def getPredictedRanking(self) -> np.ndarray:
+        """
+        Team ids ordered by decreasing rating ordinal, like main.predict_result
+        """
+        return np.argsort(-(self._mus - 3 * self._sigmas), kind="stable")
+
+    def getRankingProbabilityBounds(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (n, n) arrays, lowest and highest probability that team i is ranked above team j in the final ranking.
+        They only differ by the probability that i and j are tied on match victories after more than one match.
+        """
+        above, tied = self.getPairwiseProbabilities()
+        later_ties = tied - self._firstLossAbove - self._firstLossAbove.T
+        lowest = above + self._firstLossAbove
+        return lowest, lowest + later_ties
+
+    def _getDiscordanceProbabilities(self, ranking_probabilities: np.ndarray) -> np.ndarray:
+        """
+        (n, n) array, [p, q] is the probability that the teams predicted at positions p < q end in the other order,
+        ranking_probabilities[i, j] being the probability that team i is ranked above team j
+        """
+        predicted = self.getPredictedRanking()
+        return np.triu(ranking_probabilities[predicted[None, :], predicted[:, None]], 1)
+
+    def getKendallTauDistanceBounds(self) -> tuple[float, float]:
+        """
+        Lowest and highest possible expected kendall tau distance between the predicted and resulting ranking
+        (see kendall_tau_distance), whatever the order of the pairs tied on match victories after more than one match
+        """
+        n = len(self._mus)
+        lowest, highest = self.getRankingProbabilityBounds()
+        # the most discordant pairs give the lowest distance
+        return tuple(1 - 4 * float(self._getDiscordanceProbabilities(probabilities).sum()) / (n * (n - 1)) for probabilities in (highest, lowest))
+
+    def getWeightedKendallTauDistanceBounds(self, weights: list[float]) -> tuple[float, float]:
+        """
+        Same bounds for the weighted kendall tau distance, weights are given per predicted position (see weighted_kendall_tau_distance)
+        """
+        n = len(self._mus)
+        lowest, highest = self.getRankingProbabilityBounds()
+        # a discordant pair costs the weight of its lower predicted position
+        weights = np.asarray(weights, dtype=np.float64)[None, :]
+        return tuple(1 - 4 * float((self._getDiscordanceProbabilities(probabilities) * weights).sum()) / (n * (n - 1)) for probabilities in (highest, lowest))
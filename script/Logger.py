@@ -1,58 +1,165 @@
 import logging
+import logging.handlers
+import multiprocessing
 from utils import SAVE_LOGS, DISPLAY_LOGS
 import os
 from Team import Team
+from PhaseProfiler import profiledPhase
+
+# every simulation of a process logs through this logging.Logger, records carry the simulation name
+SIMULATION_LOGGER_NAME = "simulation"
+LOG_FORMAT = '%(processName)s - %(simulation)s - %(levelname)s - %(message)s'
+
+# queue to the log listener of the main process, set in pool workers by initWorkerLogging
+g_log_queue = None
+
+
+def _resolveLogPath(filepath: str) -> str:
+    log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), filepath)
+    log_file = os.path.normpath(log_file) # normalize path separators
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    return log_file
+
+
+def _getSimulationLogger(level, filepath) -> logging.Logger:
+    """
+    The logger shared by the simulations of this process, its handler is created with the first simulation:
+    the queue to the main process in pool workers, otherwise the file of the first simulation or the console.
+    """
+    logger = logging.getLogger(SIMULATION_LOGGER_NAME)
+    logger.setLevel(level)
+    if not logger.handlers:
+        if g_log_queue is not None:
+            handler = logging.handlers.QueueHandler(g_log_queue)
+        elif filepath is not None and SAVE_LOGS == 1:
+            handler = logging.FileHandler(_resolveLogPath(filepath))
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        else:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
+
 
 class Logger:
+    """
+    Log of one simulation. Messages take lazy %-style arguments, logInfoMessage("Ties: %d", ties),
+    so they are only formatted when a record is actually emitted.
+    Use createLogger to get a NullLogger when logs are disabled.
+    """
     def __init__(self, name, level=logging.DEBUG, filepath=None):
-        self.logger = logging.getLogger(name)
-        self.logger.setLevel(level)
-        formatter = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-        
-        if filepath is not None and SAVE_LOGS == 1:
-            log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), filepath)
-            log_file = os.path.normpath(log_file) # normalize path separators
-            log_folder = os.path.dirname(log_file)
-            
-            if not os.path.exists(log_folder):
-                os.makedirs(log_folder)
-
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
-        else:
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-        
+        self.logger = _getSimulationLogger(level, filepath)
+        self._extra = {"simulation": name}
+
+    def isEnabled(self) -> bool:
+        return True
+
+    @profiledPhase("logging")
     def logRanking(self, name:str, ranking: list[Team]):
-        if not DISPLAY_LOGS: 
-            return
-        self.logger.info(f"{name} ranking : -----------------")
+        self.logger.info("%s ranking : -----------------", name, extra=self._extra)
         for i in range(len(ranking)):
-            self.logger.info(f"{i+1} - {ranking[i].get_name()} ({ranking[i].get_rating_str()} | {ranking[i].get_score_str()})")
+            self.logger.info("%d - %s (%s | %s)", i+1, ranking[i].get_name(), ranking[i].get_rating_str(), ranking[i].get_score_str(), extra=self._extra)
 
-    def logWinningOdds(self, teams: tuple[Team, Team, Team], odds: list[float]): 
-        if not DISPLAY_LOGS: 
-            return
-        self.logger.info("winning odds for teams ---------------------------------")
+    @profiledPhase("logging")
+    def logWinningOdds(self, teams: tuple[Team, Team, Team], odds: list[float]):
+        self.logger.info("winning odds for teams ---------------------------------", extra=self._extra)
         for i in range(3):
-            self.logger.info(f"{teams[i].get_name()}: {odds[i]}")
+            self.logger.info("%s: %s", teams[i].get_name(), odds[i], extra=self._extra)
+
+    @profiledPhase("logging")
+    def logInfoMessage(self, message: str, *args):
+        self.logger.info(message, *args, extra=self._extra)
+
+    @profiledPhase("logging")
+    def logWarningMessage(self, message: str, *args):
+        self.logger.warning(message, *args, extra=self._extra)
+
+    @profiledPhase("logging")
+    def logErrorMessage(self, message: str, *args):
+        self.logger.error(message, *args, extra=self._extra)
+
+
+class NullLogger:
+    """
+    Logger used when DISPLAY_LOGS is off: every call returns at once, without formatting anything.
+    Call sites building costly arguments check isEnabled() first.
+    """
+    def isEnabled(self) -> bool:
+        return False
+
+    def logRanking(self, name:str, ranking: list[Team]):
+        pass
+
+    def logWinningOdds(self, teams: tuple[Team, Team, Team], odds: list[float]):
+        pass
+
+    def logInfoMessage(self, message: str, *args):
+        pass
+
+    def logWarningMessage(self, message: str, *args):
+        pass
+
+    def logErrorMessage(self, message: str, *args):
+        pass
+
+
+NULL_LOGGER = NullLogger()
+
+
+def createLogger(name, filepath=None) -> Logger | NullLogger:
+    return Logger(name, filepath=filepath) if DISPLAY_LOGS else NULL_LOGGER
+
+
+class WorkerFileHandler(logging.Handler):
+    """
+    Writes each record in the file of the process that emitted it: <folder>/<process name>.log
+    """
+    def __init__(self, folder: str) -> None:
+        super().__init__()
+        self._folder = folder
+        self._handlers: dict[str, logging.FileHandler] = {}
+
+    def emit(self, record: logging.LogRecord):
+        handler = self._handlers.get(record.processName)
+        if handler is None:
+            handler = logging.FileHandler(_resolveLogPath(os.path.join(self._folder, f"{record.processName}.log")))
+            handler.setFormatter(self.formatter)
+            self._handlers[record.processName] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+
+def startLogListener(folder: str) -> logging.handlers.QueueListener | None:
+    """
+    Starts the thread of the main process writing the records sent by the pool workers, one file per worker
+    in <folder>logs/ when SAVE_LOGS is on, the console otherwise. Returns None when logs are disabled.
+    The workers must be started with initWorkerLogging(listener.queue).
+    """
+    if not DISPLAY_LOGS:
+        return None
+
+    handler = WorkerFileHandler(folder + "logs/") if SAVE_LOGS == 1 else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(multiprocessing.Queue(), handler)
+    listener.start()
+    return listener
 
-    def logInfoMessage(self, message: str):
-        if not DISPLAY_LOGS: 
-            return
-        self.logger.info(message)
 
-    def logWarningMessage(self, message: str):
-        if not DISPLAY_LOGS: 
-            return
-        self.logger.warning(message)
+def stopLogListener(listener: logging.handlers.QueueListener | None):
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
 
-    def logErrorMessage(self, message: str):
-        if not DISPLAY_LOGS: 
-            return
-        self.logger.error(message)
-    
 
-    
\ No newline at end of file
+def initWorkerLogging(log_queue):
+    """
+    Pool initializer sending the records of the worker to the listener of the main process
+    """
+    global g_log_queue
+    g_log_queue = log_queue
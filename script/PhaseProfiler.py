@@ -0,0 +1,172 @@
+import cProfile
+import functools
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+
+# phases timed by --profile, in report order. Times are inclusive: play_match contains the predict_win of its rounds
+PROFILE_PHASES = ("simulation", "generate_teams", "pairing", "play_match", "predict_win", "kendall_tau", "logging", "io")
+PROFILE_FOLDER_NAME = "profile"
+PROFILE_FILE_NAME = "profile.json"
+
+
+class PhaseTimer:
+    """
+    Calls and total time of one phase, used as a context manager around the timed code
+    """
+    __slots__ = ("calls", "seconds", "_start")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+
+
+class PhaseProfiler:
+    """
+    Phase timers of one process. Use getProfiler() to get a NullProfiler when profiling is off.
+    """
+    def __init__(self, folder: str, cprofile: bool = False) -> None:
+        self._folder = folder
+        self._timers: dict[str, PhaseTimer] = {}
+        self._cprofile = cProfile.Profile() if cprofile else None
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def isEnabled(self) -> bool:
+        return True
+
+    def measure(self, phase: str) -> PhaseTimer:
+        timer = self._timers.get(phase)
+        if timer is None:
+            timer = self._timers[phase] = PhaseTimer()
+        return timer
+
+    def toDict(self) -> dict:
+        return {phase: {"calls": timer.calls, "seconds": timer.seconds} for phase, timer in self._timers.items()}
+
+    def save(self):
+        """
+        Writes the timers of this process in <folder>profile/<process name>-<pid>.json, and its cProfile stats
+        in a .prof file next to it when they are collected
+        """
+        process = multiprocessing.current_process()
+        profile_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), self._folder, PROFILE_FOLDER_NAME))
+        os.makedirs(profile_folder, exist_ok=True)
+        file_name = f"{process.name}-{process.pid}"
+        with open(os.path.join(profile_folder, file_name + ".json"), 'w') as file:
+            json.dump({"process": process.name, "phases": self.toDict()}, file)
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(os.path.join(profile_folder, file_name + ".prof"))
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class NullProfiler:
+    """
+    Profiler used without --profile: measure() returns the same no-op context manager for every phase
+    """
+    def isEnabled(self) -> bool:
+        return False
+
+    def measure(self, phase: str) -> _NullTimer:
+        return NULL_TIMER
+
+
+NULL_PROFILER = NullProfiler()
+# profiler of the current process
+g_profiler: PhaseProfiler | NullProfiler = NULL_PROFILER
+
+
+def getProfiler() -> PhaseProfiler | NullProfiler:
+    return g_profiler
+
+
+def profiledPhase(phase: str):
+    """
+    Decorator timing every call of a function as phase
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with g_profiler.measure(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def startProfiling(folder: str, cprofile: bool = False) -> PhaseProfiler:
+    """
+    Starts timing the phases of this process. In a pool worker, the profile is saved when the worker exits,
+    which only happens when the pool is closed and joined (a terminated pool kills its workers).
+    """
+    global g_profiler
+    g_profiler = PhaseProfiler(folder, cprofile)
+    if multiprocessing.parent_process() is not None:
+        multiprocessing.util.Finalize(None, g_profiler.save, exitpriority=10)
+    return g_profiler
+
+
+def mergeProfiles(folder: str) -> dict:
+    """
+    Sums the phase timers saved by every process of a run (a resumed run adds to the profile of its first part)
+    and saves them in <folder>profile.json:
+    {"processes": n, "phases": {phase: {"calls", "seconds", "processes": {process: seconds}}}}
+    """
+    profile_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), folder, PROFILE_FOLDER_NAME))
+    phases: dict[str, dict] = {}
+    processes = 0
+    for file_name in sorted(os.listdir(profile_folder)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(profile_folder, file_name)) as file:
+            profile = json.load(file)
+        processes += 1
+        for phase, timer in profile["phases"].items():
+            merged = phases.setdefault(phase, {"calls": 0, "seconds": 0.0, "processes": {}})
+            merged["calls"] += timer["calls"]
+            merged["seconds"] += timer["seconds"]
+            merged["processes"][profile["process"]] = merged["processes"].get(profile["process"], 0.0) + timer["seconds"]
+
+    ordered = {phase: phases[phase] for phase in PROFILE_PHASES if phase in phases}
+    ordered.update({phase: timer for phase, timer in phases.items() if phase not in ordered})
+    merged_profile = {"processes": processes, "phases": ordered}
+    with open(os.path.join(os.path.dirname(profile_folder), PROFILE_FILE_NAME), 'w') as file:
+        json.dump(merged_profile, file, indent=2)
+    return merged_profile
+
+
+def formatProfileTable(profile: dict) -> str:
+    """
+    One line per phase: calls, total seconds (summed over processes), mean time per call and share of the simulation time
+    """
+    phases = profile["phases"]
+    simulation_seconds = phases["simulation"]["seconds"] if "simulation" in phases else 0.0
+    lines = ["%-16s %12s %12s %12s %8s" % ("phase", "calls", "seconds", "us/call", "share")]
+    for phase, timer in phases.items():
+        per_call = 1e6 * timer["seconds"] / timer["calls"] if timer["calls"] > 0 else 0.0
+        share = "%7.1f%%" % (100 * timer["seconds"] / simulation_seconds) if simulation_seconds > 0 else ""
+        lines.append("%-16s %12d %12.3f %12.1f %8s" % (phase, timer["calls"], timer["seconds"], per_call, share))
+    return "\n".join(lines)
@@ -1,7 +1,72 @@
-from itertools import combinations
+import numpy as np
 from Team import Team
+from PhaseProfiler import profiledPhase
 
 
+def _count_inversions(sequence: list[int]) -> int:
+    """
+    Number of pairs i < j with sequence[i] > sequence[j], by merge sort in O(n log n).
+    """
+    inversions = 0
+    width = 1
+    n = len(sequence)
+    current = list(sequence)
+
+    # bottom-up merge sort, counting for each element taken from the right run how many are left in the left run
+    while width < n:
+        merged = []
+        for start in range(0, n, 2 * width):
+            left = current[start:start + width]
+            right = current[start + width:start + 2 * width]
+            i = j = 0
+            while i < len(left) and j < len(right):
+                if left[i] <= right[j]:
+                    merged.append(left[i])
+                    i += 1
+                else:
+                    merged.append(right[j])
+                    inversions += len(left) - i
+                    j += 1
+            merged += left[i:]
+            merged += right[j:]
+        current = merged
+        width *= 2
+
+    return inversions
+
+
+def _count_preceding_greater(positions: np.ndarray) -> np.ndarray:
+    """
+    For every row of positions (k, n), each holding a permutation of 0..n-1, counts for each element how many
+    elements before it in the row are greater. Fenwick tree over all rows at once: O(n log n) vector operations of size k.
+    """
+    row_count, n = positions.shape
+    rows = np.arange(row_count)
+    # index 0 is never written to and absorbs the finished walks
+    tree = np.zeros((row_count, n + 1), dtype=np.int64)
+    preceding_greater = np.zeros((row_count, n), dtype=np.int64)
+
+    for i in range(n):
+        # elements already inserted that are lower than or equal to the current one
+        index = positions[:, i] + 1
+        lower_count = np.zeros(row_count, dtype=np.int64)
+        while index.any():
+            lower_count += tree[rows, index]
+            index = index - (index & -index)
+        preceding_greater[:, i] = i - lower_count
+
+        index = positions[:, i] + 1
+        while True:
+            in_tree = index <= n
+            if not in_tree.any():
+                break
+            tree[rows[in_tree], index[in_tree]] += 1
+            index = index + (index & -index)
+
+    return preceding_greater
+
+
+@profiledPhase("kendall_tau")
 def kendall_tau_distance(predicted: list[Team], actual: list[Team]):
 
     n = len(predicted)
@@ -10,13 +75,9 @@ def kendall_tau_distance(predicted: list[Team], actual: list[Team]):
     # Create dictionary mapping team names to their indices in the predicted list
     index_dict = {(team.get_name()): i for i, team in enumerate(predicted)}
     
-    # Compute number of pairwise disagreements between predicted and actual rankings
-    disagreements = 0
-    for team1, team2 in combinations(actual, 2):
-        pred1, pred2 = index_dict[team1.get_name()], index_dict[team2.get_name()]
-        actual1, actual2 = actual.index(team1), actual.index(team2)
-        if (pred1 - pred2) * (actual1 - actual2) < 0:
-            disagreements += 1
+    # Pairwise disagreements between predicted and actual rankings are the inversions
+    # of the predicted positions listed in the actual order
+    disagreements = _count_inversions([index_dict[team.get_name()] for team in actual])
     
     # Compute Kendall tau distance
     tau_distance = 1 - 4 * disagreements / (n * (n - 1))
@@ -25,28 +86,111 @@ def kendall_tau_distance(predicted: list[Team], actual: list[Team]):
     return tau_distance, disagreements
 
 
+@profiledPhase("kendall_tau")
+def kendall_tau_distance_batch(predicted: np.ndarray, actual: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Kendall tau distance of many rankings at once: predicted and actual are (k, n) arrays of team ids,
+    best team first. Returns the (k,) tau distances and disagreements, same values as kendall_tau_distance.
+    """
+    predicted = np.atleast_2d(predicted)
+    actual = np.atleast_2d(actual)
+    assert predicted.shape == actual.shape
+    n = predicted.shape[1]
+
+    predicted_position = np.empty_like(predicted)
+    np.put_along_axis(predicted_position, predicted, np.arange(n)[None, :], axis=1)
+    positions = np.take_along_axis(predicted_position, actual, axis=1)
+
+    disagreements = _count_preceding_greater(positions).sum(axis=1)
+    tau_distance = 1 - 4 * disagreements / (n * (n - 1))
+    return tau_distance, disagreements
+
+
+def _preceding_greater_counts(sequence: list[int]) -> list[int]:
+    """
+    For a permutation of 0..n-1, counts for each element how many elements before it are greater (Fenwick tree, O(n log n)).
+    """
+    n = len(sequence)
+    tree = [0] * (n + 1)
+    counts = []
+    for i, value in enumerate(sequence):
+        index = value + 1
+        lower_count = 0
+        while index > 0:
+            lower_count += tree[index]
+            index -= index & -index
+        counts.append(i - lower_count)
+
+        index = value + 1
+        while index <= n:
+            tree[index] += 1
+            index += index & -index
+    return counts
+
+
+@profiledPhase("kendall_tau")
 def weighted_kendall_tau_distance(expected_ranking, predicted_ranking, weights):
 
     assert len(expected_ranking) == len(predicted_ranking) == len(weights), "All lists must have the same length."
 
     n = len(expected_ranking)
-    discordant_pairs = 0
-    for i in range(n):
-        for j in range(i+1, n):
-            # Check if the order of the two teams in the expected ranking is the same as the order in the predicted ranking
-            if (expected_ranking.index(expected_ranking[i]) < expected_ranking.index(expected_ranking[j]) and
-                    predicted_ranking.index(expected_ranking[i]) > predicted_ranking.index(expected_ranking[j])):
-                discordant_pairs += weights[j]
-            elif (expected_ranking.index(expected_ranking[i]) > expected_ranking.index(expected_ranking[j]) and
-                    predicted_ranking.index(expected_ranking[i]) < predicted_ranking.index(expected_ranking[j])):
-                discordant_pairs += weights[i]
+    predicted_index = {team: i for i, team in enumerate(predicted_ranking)}
+
+    # A pair i < j of the expected ranking is discordant when expected_ranking[j] is predicted above expected_ranking[i],
+    # and costs the weight of the lower expected position j
+    preceding_greater = _preceding_greater_counts([predicted_index[team] for team in expected_ranking])
+    discordant_pairs = sum(weight * count for weight, count in zip(weights, preceding_greater) if count > 0)
 
     # Calculate the weighted Kendall Tau distance
     weighted_tau = 1 - 4 * discordant_pairs / (n * (n - 1))
     return weighted_tau, discordant_pairs
 
 
+@profiledPhase("kendall_tau")
+def weighted_kendall_tau_distance_batch(expected: np.ndarray, predicted: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    weighted_kendall_tau_distance of many rankings at once: expected and predicted are (k, n) arrays of team ids,
+    weights is a (n,) vector of position weights or one vector per ranking (k, n).
+    """
+    expected = np.atleast_2d(expected)
+    predicted = np.atleast_2d(predicted)
+    assert expected.shape == predicted.shape
+    n = expected.shape[1]
+
+    predicted_position = np.empty_like(predicted)
+    np.put_along_axis(predicted_position, predicted, np.arange(n)[None, :], axis=1)
+    positions = np.take_along_axis(predicted_position, expected, axis=1)
+
+    discordant_pairs = (_count_preceding_greater(positions) * np.asarray(weights, dtype=np.float64)).sum(axis=1)
+    weighted_tau = 1 - 4 * discordant_pairs / (n * (n - 1))
+    return weighted_tau, discordant_pairs
+
+# ======================================================================================
+# position weights, index 0 is the top of the expected ranking
+
+def neutral_weights(n: int) -> list[float]:
+    return [1] * n
+
+def top_k_weights(n: int, k: int, top_weight: float = 2, other_weight: float = 1) -> list[float]:
+    return [top_weight] * min(k, n) + [other_weight] * max(n - k, 0)
 
+def hyperbolic_weights(n: int) -> list[float]:
+    return [1 / (i + 1) for i in range(n)]
 
+def normalized_weights(weights: list[float]) -> list[float]:
+    """
+    Rescales weights so they sum to the number of positions, like the neutral weights
+    """
+    total = sum(weights)
+    return [len(weights) * w / total for w in weights]
 
+# weight families usable by name (e.g. from the command line), all normalized
+WEIGHT_FAMILIES = {
+    "neutral": lambda n: neutral_weights(n),
+    "top3": lambda n: normalized_weights(top_k_weights(n, 3)),
+    "tophalf": lambda n: normalized_weights(top_k_weights(n, n // 2)),
+    "hyperbolic": lambda n: normalized_weights(hyperbolic_weights(n)),
+}
 
+def get_weights(family: str, n: int) -> list[float]:
+    return WEIGHT_FAMILIES[family](n)
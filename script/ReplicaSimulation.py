@@ -0,0 +1,147 @@
+from itertools import combinations
+import numpy as np
+from utils import *
+from Team import computeScores, rankOrderFromScores
+from WinProbability import predictWinArray
+from AlaraMatchBatch import playMatchBatch, drawRoundWinners, resolveMatchBatch
+from AlaraMatchModel import sampleMatchBatch
+from RoundTrace import getRoundTrace
+from RankingComparator import kendall_tau_distance_batch, weighted_kendall_tau_distance_batch
+
+# formats whose schedule doesn't depend on results (or only on bracket position) and can be played by replicas
+REPLICA_FORMATS = (1, 2)
+
+
+class ReplicaSimulation:
+    """
+    Plays K independent tournaments of the same format and size at once.
+    Ratings, counters and rankings are arrays of shape [replica, ...] and every match of a tournament stage
+    (a knockout level, the whole round-robin) is simulated for all replicas in one batch.
+    """
+    _format: int
+    _teamCount: int
+    _replicaCount: int
+    _rng: np.random.Generator
+
+    def __init__(self, format: int, team_count: int, replica_count: int, rng: np.random.Generator, first_simulation: int = 0) -> None:
+        if format not in REPLICA_FORMATS:
+            raise Exception(f"Replica simulation is not available for the {getTournamentFormatStr(format)} format")
+        if format == 1 and not is_power_of(team_count, TEAMS_IN_ONE_MATCH):
+            raise Exception("Single knockout needs for base participants unfulfilled (need power of 3)")
+
+        self._format = format
+        self._teamCount = team_count
+        self._replicaCount = replica_count
+        self._rng = rng
+        # simulation index of replica 0, replicas are traced as simulations first_simulation, first_simulation + 1, ...
+        self._firstSimulation = first_simulation
+
+        # same field as main.generate_teams, one row per replica
+        self.mus = rng.normal(25, 25 / 3, (replica_count, team_count))
+        self.sigmas = np.full((replica_count, team_count), 0.1)
+        self.counters = np.zeros((replica_count, team_count, COUNTER_COUNT), dtype=np.int64)
+        # matches played by each replica
+        self._matchCount = 0
+
+    def _playStage(self, matchups: np.ndarray) -> np.ndarray:
+        """
+        Plays matchups (K, m, 3) of team ids, adds the counters of every team and returns the winner ids (K, m)
+        """
+        replica_count, match_count, _ = matchups.shape
+        replica_index = np.arange(replica_count)[:, None, None]
+        odds = predictWinArray(self.mus[replica_index, matchups], self.sigmas[replica_index, matchups])
+
+        trace = getRoundTrace()
+        if MATCH_ENGINE == 2:
+            winners, _, counters = sampleMatchBatch(odds.reshape(-1, TEAMS_IN_ONE_MATCH), self._rng)
+        elif trace is not None:
+            # same draws as playMatchBatch, the round winners are kept for the trace
+            round_winners = drawRoundWinners(odds.reshape(-1, TEAMS_IN_ONE_MATCH), self._rng)
+            winners, round_counts, counters = resolveMatchBatch(round_winners)
+            trace.addMatches(np.repeat(np.arange(replica_count) + self._firstSimulation, match_count), np.tile(np.arange(match_count) + self._matchCount, replica_count),
+                             matchups.reshape(-1, TEAMS_IN_ONE_MATCH), odds.reshape(-1, TEAMS_IN_ONE_MATCH), round_winners, round_counts)
+        else:
+            winners, _, counters = playMatchBatch(odds.reshape(-1, TEAMS_IN_ONE_MATCH), self._rng)
+
+        flat_team_index = (replica_index * self._teamCount + matchups).ravel()
+        np.add.at(self.counters.reshape(-1, COUNTER_COUNT), flat_team_index, counters.reshape(-1, COUNTER_COUNT))
+        self._matchCount += match_count
+
+        return np.take_along_axis(matchups, winners.reshape(replica_count, match_count, 1), axis=2)[:, :, 0]
+
+    def _playRoundRobin(self):
+        all_matches = np.array(list(combinations(range(self._teamCount), TEAMS_IN_ONE_MATCH)), dtype=np.int64)
+        self._playStage(np.broadcast_to(all_matches, (self._replicaCount,) + all_matches.shape))
+
+    def _playSingleKnockout(self):
+        # brackets are consecutive teams, winners of 3 consecutive brackets meet at the next level
+        brackets = np.broadcast_to(np.arange(self._teamCount).reshape(-1, TEAMS_IN_ONE_MATCH), (self._replicaCount, self._teamCount // TEAMS_IN_ONE_MATCH, TEAMS_IN_ONE_MATCH))
+        while True:
+            winners = self._playStage(brackets)
+            if winners.shape[1] == 1:
+                break
+            brackets = winners.reshape(self._replicaCount, -1, TEAMS_IN_ONE_MATCH)
+
+    def play(self) -> np.ndarray:
+        """
+        Plays the K tournaments and returns their final rankings as team ids (K, n), best team first
+        """
+        match self._format:
+            case 1: self._playSingleKnockout()
+            case 2: self._playRoundRobin()
+
+        self.scores = computeScores(self.counters)
+        self.ranking = rankOrderFromScores(self.scores)
+        return self.ranking
+
+    def getPredictedRanking(self) -> np.ndarray:
+        """
+        Team ids (K, n) ordered by decreasing rating ordinal, like main.predict_result
+        """
+        ordinals = self.mus - 3 * self.sigmas
+        return np.argsort(-ordinals, axis=1, kind="stable")
+
+    def getMatchCount(self) -> int:
+        return self._matchCount
+
+    def getTieCounts(self) -> np.ndarray:
+        """
+        Teams sharing the score of a better ranked team, per replica (same count as aTournament.getTieCount)
+        """
+        sorted_scores = np.take_along_axis(self.scores, self.ranking[:, :, None], axis=1)
+        same_as_previous = np.all(sorted_scores[:, 1:] == sorted_scores[:, :-1], axis=2)
+        return same_as_previous.sum(axis=1)
+
+    def getCompleteDuplicateMatchupCounts(self) -> np.ndarray:
+        # neither the round-robin nor the knockout schedule can put the same three teams together twice
+        return np.zeros(self._replicaCount, dtype=np.int64)
+
+    def getKendallTauDistances(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Kendall tau distance and disagreements between the predicted and resulting ranking of every replica
+        """
+        return kendall_tau_distance_batch(self.getPredictedRanking(), self.ranking)
+
+    def getWeightedKendallTauDistances(self, weights: list[float]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Weighted kendall tau distance of every replica, weights are given per predicted position
+        """
+        return weighted_kendall_tau_distance_batch(self.getPredictedRanking(), self.ranking, weights)
+
+    def getResultColumns(self, weights: list[float] = None) -> list[np.ndarray]:
+        """
+        Kendall tau distances, disagreements, match counts, tie counts and complete duplicate matches of the replicas (K,),
+        followed by the weighted kendall tau distances and discordances when weights are given
+        """
+        tau_distances, disagreements = self.getKendallTauDistances()
+        columns = [tau_distances, disagreements, np.full(self._replicaCount, self.getMatchCount()), self.getTieCounts(), self.getCompleteDuplicateMatchupCounts()]
+        if weights is not None:
+            columns += self.getWeightedKendallTauDistances(weights)
+        return columns
+
+    def getResults(self, weights: list[float] = None) -> list[tuple]:
+        """
+        One (kendall tau distance, disagreements, match count, tie count, complete duplicate matches) row per replica,
+        followed by the weighted kendall tau distance and discordance when weights are given
+        """
+        return list(zip(*(column.tolist() for column in self.getResultColumns(weights))))
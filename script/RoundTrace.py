@@ -0,0 +1,202 @@
+import os
+import multiprocessing
+import numpy as np
+from utils import *
+from PhaseProfiler import profiledPhase
+
+# one fixed-width record per round played (39 bytes)
+ROUND_TRACE_DTYPE = np.dtype([
+    ("simulation", "<i8"),
+    ("match", "<i4"),           # match number inside the simulation, in playing order
+    ("round", "u1"),            # round number inside the match
+    ("defender", "u1"),         # index in teams of the defending team
+    ("winner", "u1"),           # index in teams of the round winner
+    ("teams", "<i4", (TEAMS_IN_ONE_MATCH,)),            # team ids (TeamTable rows) in matchup order
+    ("probabilities", "<f4", (TEAMS_IN_ONE_MATCH,)),    # round win probability of each team
+])
+ROUND_TRACE_MAGIC = b"ALARATRC"
+ROUND_TRACE_VERSION = 1
+# magic, version, record size
+ROUND_TRACE_HEADER_SIZE = len(ROUND_TRACE_MAGIC) + 8
+ROUND_TRACE_EXTENSION = ".rtrace"
+# records kept in memory before they are appended to the file
+ROUND_TRACE_BUFFER_SIZE = 1 << 16
+
+
+class RoundTraceWriter:
+    """
+    Append-only binary file of ROUND_TRACE_DTYPE records. Records are buffered in a numpy array and written as raw bytes,
+    so a round costs a few array assignments instead of formatted text lines.
+    The simulation and match numbers of tournament matches are tracked by the writer (setSimulation, beginMatch).
+    """
+    def __init__(self, path: str, buffer_size: int = ROUND_TRACE_BUFFER_SIZE) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if is_new_file:
+            self._file.write(ROUND_TRACE_MAGIC + np.array([ROUND_TRACE_VERSION, ROUND_TRACE_DTYPE.itemsize], dtype="<u4").tobytes())
+            self._file.flush()
+
+        self._buffer = np.zeros(buffer_size, dtype=ROUND_TRACE_DTYPE)
+        self._size = 0
+        self._simulation = 0
+        self._matchCount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def setSimulation(self, simulation: int):
+        self._simulation = simulation
+        self._matchCount = 0
+
+    def beginMatch(self) -> int:
+        """
+        Number of the next match of the current simulation
+        """
+        self._matchCount += 1
+        return self._matchCount - 1
+
+    def _reserve(self, count: int) -> np.ndarray:
+        if self._size + count > len(self._buffer):
+            self.flush()
+        if count > len(self._buffer):
+            self._buffer = np.zeros(count, dtype=ROUND_TRACE_DTYPE)
+        records = self._buffer[self._size:self._size + count]
+        self._size += count
+        return records
+
+    def addRound(self, match: int, round_index: int, team_ids, defender: int, winner: int, probabilities):
+        record = self._reserve(1)
+        record["simulation"] = self._simulation
+        record["match"] = match
+        record["round"] = round_index
+        record["defender"] = defender
+        record["winner"] = winner
+        record["teams"] = team_ids
+        record["probabilities"] = probabilities
+
+    def addMatches(self, simulations, matches, team_ids: np.ndarray, probabilities: np.ndarray, round_winners: np.ndarray, round_counts: np.ndarray):
+        """
+        Records the rounds played by a batch of m matches: round_winners (m, MAX_ROUNDS_IN_MATCH) as drawn by
+        AlaraMatchBatch.drawRoundWinners, of which only the first round_counts (m,) were played.
+        simulations and matches are the numbers of each match, arrays (m,) or scalars.
+        """
+        played = np.arange(MAX_ROUNDS_IN_MATCH) < np.asarray(round_counts)[:, None]
+        match_index, round_index = np.nonzero(played)
+        records = self._reserve(len(match_index))
+        records["simulation"] = np.broadcast_to(simulations, played.shape[:1])[match_index]
+        records["match"] = np.broadcast_to(matches, played.shape[:1])[match_index]
+        records["round"] = round_index
+        records["defender"] = round_index % TEAMS_IN_ONE_MATCH
+        records["winner"] = round_winners[match_index, round_index]
+        records["teams"] = team_ids[match_index]
+        records["probabilities"] = probabilities[match_index]
+
+    def addTournamentMatches(self, team_ids: np.ndarray, probabilities: np.ndarray, round_winners: np.ndarray, round_counts: np.ndarray):
+        """
+        addMatches for the next matches of the current simulation
+        """
+        first_match = self._matchCount
+        self._matchCount += len(team_ids)
+        self.addMatches(self._simulation, np.arange(first_match, self._matchCount), team_ids, probabilities, round_winners, round_counts)
+
+    @profiledPhase("io")
+    def flush(self):
+        self._file.write(self._buffer[:self._size].tobytes())
+        self._file.flush()
+        self._size = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+# trace of the current process, None when tracing is off
+g_round_trace: RoundTraceWriter = None
+
+
+def getRoundTrace() -> RoundTraceWriter | None:
+    return g_round_trace
+
+
+def openRoundTrace(folder: str) -> RoundTraceWriter:
+    """
+    Starts tracing the rounds played by this process in <folder>traces/<process name>-<pid>.rtrace
+    (folder is relative to the script folder, like the results folders)
+    """
+    global g_round_trace
+    trace_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), folder, "traces"))
+    process = multiprocessing.current_process()
+    g_round_trace = RoundTraceWriter(os.path.join(trace_folder, f"{process.name}-{process.pid}{ROUND_TRACE_EXTENSION}"))
+    return g_round_trace
+
+
+def readRoundTrace(path: str) -> np.ndarray:
+    """
+    Memory-mapped records of one trace file
+    """
+    with open(path, 'rb') as file:
+        header = file.read(ROUND_TRACE_HEADER_SIZE)
+    if header[:len(ROUND_TRACE_MAGIC)] != ROUND_TRACE_MAGIC:
+        raise Exception(f"{path} is not a round trace")
+    version, record_size = np.frombuffer(header[len(ROUND_TRACE_MAGIC):], dtype="<u4")
+    if version != ROUND_TRACE_VERSION or record_size != ROUND_TRACE_DTYPE.itemsize:
+        raise Exception(f"{path} has an unsupported round trace format (version {version})")
+
+    record_count = (os.path.getsize(path) - ROUND_TRACE_HEADER_SIZE) // ROUND_TRACE_DTYPE.itemsize
+    if record_count == 0:
+        return np.zeros(0, dtype=ROUND_TRACE_DTYPE)
+    return np.memmap(path, dtype=ROUND_TRACE_DTYPE, mode='r', offset=ROUND_TRACE_HEADER_SIZE, shape=(record_count,))
+
+
+def loadRoundTraces(folder: str, simulations = None) -> np.ndarray:
+    """
+    Records of every trace file of a run folder, ordered by simulation, match and round.
+    simulations optionally restricts them to some simulation numbers.
+    """
+    trace_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), folder, "traces"))
+    parts = []
+    for file_name in sorted(os.listdir(trace_folder)):
+        if file_name.endswith(ROUND_TRACE_EXTENSION):
+            records = readRoundTrace(os.path.join(trace_folder, file_name))
+            if simulations is not None:
+                records = records[np.isin(records["simulation"], simulations)]
+            parts.append(np.asarray(records))
+
+    records = np.concatenate(parts) if parts else np.zeros(0, dtype=ROUND_TRACE_DTYPE)
+    return records[np.lexsort((records["round"], records["match"], records["simulation"]))]
+
+
+def indexRoundTraces(folder: str) -> dict[int, list[tuple[str, int, int]]]:
+    """
+    (file, start, stop) record ranges of every simulation traced in a run folder, in file order.
+    A simulation traced twice (played again by a resumed run) keeps the file holding the most records of it,
+    the other one may have been cut by the interruption.
+    """
+    trace_folder = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), folder, "traces"))
+    index: dict[int, list[tuple[str, int, int]]] = {}
+    for file_name in sorted(os.listdir(trace_folder)):
+        if not file_name.endswith(ROUND_TRACE_EXTENSION):
+            continue
+        path = os.path.join(trace_folder, file_name)
+        simulations = np.asarray(readRoundTrace(path)["simulation"])
+        if len(simulations) == 0:
+            continue
+
+        # a worker writes the rounds of a simulation together (by stage for replicas)
+        starts = np.flatnonzero(np.r_[True, simulations[1:] != simulations[:-1]])
+        stops = np.r_[starts[1:], len(simulations)]
+        file_ranges: dict[int, list[tuple[str, int, int]]] = {}
+        for simulation, start, stop in zip(simulations[starts].tolist(), starts.tolist(), stops.tolist()):
+            file_ranges.setdefault(simulation, []).append((path, start, stop))
+
+        for simulation, ranges in file_ranges.items():
+            known = index.get(simulation)
+            if known is None or sum(stop - start for _, start, stop in ranges) > sum(stop - start for _, start, stop in known):
+                index[simulation] = ranges
+    return index
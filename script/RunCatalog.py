@@ -0,0 +1,202 @@
+import os
+import re
+import sqlite3
+import numpy as np
+from utils import *
+from csvManager import read_result_columns, get_results_path, read_run_config, read_summary, RUN_CONFIG_FILE_NAME
+
+CATALOG_FILE = "./simulations/catalog.sqlite"
+# flat result files of a batch folder, e.g. 9t-SwissSystem.csv (see sweep.export_for_plots) or 9t-Round-Robin.csv
+FLAT_RESULT_FILE_PATTERN = re.compile(r"^(\d+)t-([A-Za-z-]+)\.csv$")
+ROUNDS_FOLDER_PATTERN = re.compile(r"^(\d+)rounds$")
+FORMAT_BY_FILE_NAME = {"SingleKnockout": 1, "SK": 1, "RoundRobin": 2, "RR": 2, "SwissSystem": 3, "SS": 3, "Custom": 4}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    format INTEGER,
+    n_teams INTEGER,
+    rounds INTEGER,
+    n_simulations INTEGER,
+    seed INTEGER,
+    row_count INTEGER NOT NULL,
+    tau_mean REAL,
+    tau_std REAL,
+    tau_ci REAL,
+    disagreement_mean REAL,
+    match_count REAL,
+    tie_mean REAL,
+    duplicate_mean REAL
+);
+CREATE INDEX IF NOT EXISTS runs_format_teams ON runs (format, n_teams, rounds);
+-- csv files that aren't result files, only warned about again once they change
+CREATE TABLE IF NOT EXISTS skipped (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+
+class RunCatalog:
+    """
+    SQLite index of every result file under a folder: the parameters of the run and summary statistics of its results.
+    update() only reads the files created or modified since the last update, queries then never touch the results.
+    Paths are stored relative to the script folder, like the folders given to csvManager.
+    """
+    _connection: sqlite3.Connection
+
+    def __init__(self, database_file: str = CATALOG_FILE) -> None:
+        database_path = get_results_path(os.path.dirname(database_file), os.path.basename(database_file))
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+        self._root = os.path.dirname(os.path.abspath(__file__))
+        self._connection = sqlite3.connect(database_path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+    def _relativePath(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(os.path.join(self._root, path)), self._root).replace(os.sep, "/")
+
+    def _readParameters(self, csv_file: str) -> dict | None:
+        """
+        Run parameters from the run.json next to a final_results.csv, or from the name of a flat result file
+        """
+        folder, file_name = os.path.split(csv_file)
+        if file_name == "final_results.csv":
+            if not os.path.exists(os.path.join(folder, RUN_CONFIG_FILE_NAME)):
+                return {}
+            config = read_run_config(folder)
+            return {key: config.get(key) for key in ("format", "n_teams", "rounds", "n_simulations", "seed")}
+
+        match = FLAT_RESULT_FILE_PATTERN.match(file_name)
+        # format names are also written with their hyphen (9t-Round-Robin.csv)
+        format_name = match.group(2).replace('-', '') if match else None
+        if format_name not in FORMAT_BY_FILE_NAME:
+            return None
+
+        rounds_match = ROUNDS_FOLDER_PATTERN.match(os.path.basename(folder))
+        return {
+            "format": FORMAT_BY_FILE_NAME[format_name],
+            "n_teams": int(match.group(1)),
+            "rounds": int(rounds_match.group(1)) if rounds_match else None,
+        }
+
+    def _summarize(self, csv_file: str) -> dict:
+        summary = read_summary(csv_file)
+        if summary is not None and "kendalTauDistance" in summary["columns"]:
+            return self._summarizeFromSidecar(summary)
+
+        columns = read_result_columns(csv_file)
+        tau = columns["kendalTauDistance"]
+        count = len(tau)
+        summary = {"row_count": count}
+        if count > 0:
+            summary["tau_mean"] = float(tau.mean())
+            summary["tau_std"] = float(tau.std(ddof=1)) if count > 1 else None
+            summary["tau_ci"] = 1.96 * summary["tau_std"] / np.sqrt(count) if count > 1 else None
+            for key, column in (("disagreement_mean", "disagreement"), ("match_count", "matchCount"), ("tie_mean", "tieCount"), ("duplicate_mean", "completeDuplicateMatches")):
+                if column in columns:
+                    summary[key] = float(columns[column].mean())
+        return summary
+
+    def _summarizeFromSidecar(self, summary: dict) -> dict:
+        """
+        Same values as _summarize, taken from the streaming summary of the run instead of the results
+        """
+        tau = summary["columns"]["kendalTauDistance"]
+        entry = {"row_count": summary["count"]}
+        if summary["count"] > 0:
+            entry.update(tau_mean=tau["mean"], tau_std=tau["std"], tau_ci=tau["ci"])
+            for key, column in (("disagreement_mean", "disagreement"), ("match_count", "matchCount"), ("tie_mean", "tieCount"), ("duplicate_mean", "completeDuplicateMatches")):
+                if column in summary["columns"]:
+                    entry[key] = summary["columns"][column]["mean"]
+        return entry
+
+    def updateFile(self, csv_file: str, mtime: float = None) -> bool:
+        """
+        (Re)indexes one result file, returns False when it isn't a result file
+        """
+        parameters = self._readParameters(csv_file)
+        if parameters is None:
+            return False
+
+        entry = {"path": self._relativePath(csv_file), "mtime": mtime or os.path.getmtime(csv_file), **parameters, **self._summarize(csv_file)}
+        self._connection.execute("DELETE FROM runs WHERE path = ?", (entry["path"],))
+        self._connection.execute("DELETE FROM skipped WHERE path = ?", (entry["path"],))
+        self._connection.execute(f"INSERT INTO runs ({', '.join(entry)}) VALUES ({', '.join('?' * len(entry))})", tuple(entry.values()))
+        return True
+
+    def update(self, folder: str = "./simulations/") -> int:
+        """
+        Indexes the result files of folder (recursively) that changed since the last update and forgets the deleted ones.
+        Other csv files are skipped with a warning, given once until they change. Returns the number of files read.
+        """
+        root = get_results_path(folder, "")
+        prefix = self._relativePath(root)
+        known = {row["path"]: row["mtime"] for row in self._connection.execute("SELECT path, mtime FROM runs WHERE substr(path, 1, ?) = ?", (len(prefix) + 1, prefix + "/"))}
+        skipped = {row["path"]: row["mtime"] for row in self._connection.execute("SELECT path, mtime FROM skipped WHERE substr(path, 1, ?) = ?", (len(prefix) + 1, prefix + "/"))}
+        updated = 0
+
+        for directory, subdirectories, file_names in os.walk(root):
+            # the columnar copies of the results are not result files
+            subdirectories[:] = [name for name in subdirectories if not name.endswith(".columns")]
+            for file_name in file_names:
+                if not file_name.endswith(".csv"):
+                    continue
+                csv_file = os.path.join(directory, file_name)
+                path = self._relativePath(csv_file)
+                mtime = os.path.getmtime(csv_file)
+                if known.pop(path, None) == mtime or skipped.pop(path, None) == mtime:
+                    continue
+                if self.updateFile(csv_file, mtime):
+                    updated += 1
+                else:
+                    print(f"Skipping {path}: not a result file (final_results.csv or <teams>t-<format>.csv)")
+                    self._connection.execute("INSERT OR REPLACE INTO skipped (path, mtime) VALUES (?, ?)", (path, mtime))
+
+        self._connection.executemany("DELETE FROM runs WHERE path = ?", [(path,) for path in known])
+        self._connection.executemany("DELETE FROM skipped WHERE path = ?", [(path,) for path in skipped])
+        self._connection.commit()
+        return updated
+
+    def query(self, folder: str = None, format: int = None, n_teams: int = None, rounds: int = None, recursive: bool = True) -> list[dict]:
+        """
+        Catalog entries matching every given parameter, ordered by format, team count and rounds.
+        With recursive=False, only the files directly in folder are returned.
+        """
+        conditions, values = [], []
+        if folder is not None:
+            prefix = self._relativePath(get_results_path(folder, "")) + "/"
+            conditions.append("substr(path, 1, ?) = ?")
+            values += [len(prefix), prefix]
+            if not recursive:
+                conditions.append("instr(substr(path, ?), '/') = 0")
+                values.append(len(prefix) + 1)
+        for column, value in (("format", format), ("n_teams", n_teams), ("rounds", rounds)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection.execute(f"SELECT * FROM runs {where} ORDER BY format, n_teams, rounds, path", values)
+        return [dict(row) for row in rows]
+
+    def getResultFile(self, entry: dict) -> str:
+        return os.path.normpath(os.path.join(self._root, entry["path"]))
+
+
+def get_format_file_name(format: int) -> str:
+    """
+    Format as written in flat result file names (9t-SwissSystem.csv)
+    """
+    return getTournamentFormatStr(format).replace(' ', '').replace('-', '')
@@ -0,0 +1,198 @@
+import math
+import numpy as np
+
+# z of a two-sided 95% confidence interval, same as statistic_plot_script.printStuffForAllFile
+CONFIDENCE_Z = 1.96
+# quantiles estimated for every column of a run summary
+SUMMARY_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# the cumulative mean is saved after 1, 2, ... values then every time the count grew by this factor
+CUMULATIVE_MEAN_GROWTH = 1.1
+# values kept by each level of a QuantileSketch
+QUANTILE_SKETCH_CAPACITY = 4096
+
+
+class QuantileSketch:
+    """
+    Quantile estimates of a stream of values fed in batches, in bounded memory. Values are kept exactly until a level
+    holds capacity of them, the full level is then sorted and every other value moves up to the next level, where it
+    stands for twice as many values (the kept half alternates between the even and odd positions).
+    Levels are compacted at fixed counts, so the estimates only depend on the values and their order, not on the batches.
+    Exact until capacity values are known, the rank error stays below (levels / capacity) of the count.
+    """
+    def __init__(self, capacity: int = QUANTILE_SKETCH_CAPACITY) -> None:
+        # an even capacity halves exactly
+        self._capacity = capacity + capacity % 2
+        # values of level l stand for 2^l values each
+        self._levels: list[np.ndarray] = []
+        self._offsets: list[int] = []
+
+    def addAll(self, values: np.ndarray):
+        self._push(0, np.asarray(values, dtype=np.float64))
+
+    def _push(self, level: int, values: np.ndarray):
+        while len(values) > 0:
+            if level == len(self._levels):
+                self._levels.append(np.empty(0))
+                self._offsets.append(0)
+            # a full level is compacted when more values come
+            if len(self._levels[level]) == self._capacity:
+                full = np.sort(self._levels[level])
+                self._levels[level] = np.empty(0)
+                self._push(level + 1, full[self._offsets[level]::2])
+                self._offsets[level] ^= 1
+            room = self._capacity - len(self._levels[level])
+            self._levels[level] = np.concatenate((self._levels[level], values[:room]))
+            values = values[room:]
+
+    def getValues(self, quantiles: tuple[float, ...]) -> list[float]:
+        """
+        Value of rank round(q * (count - 1)) for every quantile q, nan when no value is known
+        """
+        values = np.concatenate(self._levels) if self._levels else np.empty(0)
+        if len(values) == 0:
+            return [math.nan] * len(quantiles)
+        weights = np.concatenate([np.full(len(level), 1 << l, dtype=np.int64) for l, level in enumerate(self._levels)])
+        order = np.argsort(values, kind="stable")
+        # the value of rank r is the first one whose cumulative weight goes past r
+        cumulative_weights = np.cumsum(weights[order])
+        ranks = [int(round(quantile * (cumulative_weights[-1] - 1))) for quantile in quantiles]
+        return [float(values[order[np.searchsorted(cumulative_weights, rank, side="right")]]) for rank in ranks]
+
+
+class RunningStatistics:
+    """
+    Summary of a stream of values updated one batch at a time, without keeping the values:
+    count, mean and variance (the moments of each batch merged as in Chan et al.), min/max, a few quantiles
+    (QuantileSketch) and the cumulative mean at log-spaced counts (the convergence curve of the mean).
+    """
+    _count: int
+    _mean: float
+    _m2: float
+
+    def __init__(self, quantiles: tuple[float, ...] = SUMMARY_QUANTILES) -> None:
+        self._count = 0
+        self._mean = 0.0
+        # sum of the squared differences to the current mean
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._quantiles = quantiles
+        self._quantileSketch = QuantileSketch()
+        # [count, mean after count values]
+        self._cumulativeMeans: list[list[float]] = []
+        self._nextCumulativeMean = 1
+
+    def add(self, value: float):
+        self.addAll(np.array([value], dtype=np.float64))
+
+    def addAll(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        batch_count = len(values)
+        if batch_count == 0:
+            return
+
+        count = self._count + batch_count
+        if self._nextCumulativeMean <= count:
+            # means of the first c values for every c reached in this batch
+            sums = self._mean * self._count + np.cumsum(values)
+            while self._nextCumulativeMean <= count:
+                self._cumulativeMeans.append([self._nextCumulativeMean, float(sums[self._nextCumulativeMean - self._count - 1] / self._nextCumulativeMean)])
+                self._nextCumulativeMean = max(self._nextCumulativeMean + 1, math.floor(self._nextCumulativeMean * CUMULATIVE_MEAN_GROWTH))
+
+        batch_mean = float(values.mean())
+        delta = batch_mean - self._mean
+        self._m2 += float(np.square(values - batch_mean).sum()) + delta * delta * self._count * batch_count / count
+        self._mean += delta * batch_count / count
+        self._count = count
+
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+        self._quantileSketch.addAll(values)
+
+    def getCount(self) -> int:
+        return self._count
+
+    def getMean(self) -> float:
+        return self._mean
+
+    def getVariance(self) -> float:
+        """
+        Sample variance (n - 1 denominator, like pandas' std)
+        """
+        return self._m2 / (self._count - 1) if self._count > 1 else math.inf
+
+    def getStandardDeviation(self) -> float:
+        return math.sqrt(self.getVariance())
+
+    def getConfidenceHalfWidth(self, z: float = CONFIDENCE_Z) -> float:
+        """
+        Half-width of the confidence interval of the mean, infinite until two values are known
+        """
+        return z * self.getStandardDeviation() / math.sqrt(self._count) if self._count > 1 else math.inf
+
+    def getMin(self) -> float:
+        return self._min
+
+    def getMax(self) -> float:
+        return self._max
+
+    def getQuantiles(self) -> dict[float, float]:
+        return dict(zip(self._quantiles, self._quantileSketch.getValues(self._quantiles)))
+
+    def getCumulativeMeans(self) -> list[list[float]]:
+        """
+        [count, mean of the first count values] pairs at log-spaced counts
+        """
+        return self._cumulativeMeans
+
+    def toDict(self) -> dict:
+        """
+        Json serializable summary (m2 is kept so two summaries can be combined later)
+        """
+        return {
+            "count": self._count,
+            "mean": self._mean,
+            "m2": self._m2,
+            "std": self.getStandardDeviation() if self._count > 1 else None,
+            "ci": self.getConfidenceHalfWidth() if self._count > 1 else None,
+            "min": self._min if self._count > 0 else None,
+            "max": self._max if self._count > 0 else None,
+            "quantiles": {str(quantile): value for quantile, value in self.getQuantiles().items()} if self._count > 0 else {},
+            # ends with the current mean
+            "cumulativeMeans": self._cumulativeMeans + ([[self._count, self._mean]] if self._cumulativeMeans and self._cumulativeMeans[-1][0] != self._count else []),
+        }
+
+
+class RunSummary:
+    """
+    RunningStatistics of every numeric column of a results file, fed in file order. Rows are queued by add and
+    added to the statistics column by column when update is called, which every getter does first.
+    """
+    def __init__(self, headers: list[str]) -> None:
+        self._headers = headers
+        # simId is an identifier, not a measure
+        self._columns = {index: RunningStatistics() for index, header in enumerate(headers) if header != "simId"}
+        self._pendingRows: list = []
+
+    def add(self, row):
+        self._pendingRows.append(row)
+
+    def update(self):
+        if not self._pendingRows:
+            return
+        columns = list(zip(*self._pendingRows))
+        self._pendingRows = []
+        for index, statistics in self._columns.items():
+            statistics.addAll(np.asarray(columns[index], dtype=np.float64))
+
+    def getCount(self) -> int:
+        self.update()
+        return next(iter(self._columns.values())).getCount() if self._columns else 0
+
+    def getColumn(self, header: str) -> RunningStatistics:
+        self.update()
+        return self._columns[self._headers.index(header)]
+
+    def toDict(self) -> dict:
+        self.update()
+        return {"count": self.getCount(), "columns": {self._headers[index]: statistics.toDict() for index, statistics in self._columns.items()}}
@@ -0,0 +1,92 @@
+from multiprocessing import shared_memory
+import numpy as np
+from csvManager import RESULT_COLUMN_DTYPES
+
+
+def getSharedResultDtype(headers: list[str]) -> np.dtype:
+    """
+    Fixed-width row of the results with headers, simId is stored as the simulation index
+    """
+    return np.dtype([(header, RESULT_COLUMN_DTYPES.get(header, np.float64)) for header in headers])
+
+
+class SharedResultBuffer:
+    """
+    Result rows of a run in a shared memory block, one slot per simulation index.
+    Workers write their rows in place (store) and only send their indices back, the main process reads
+    the rows (read) when it saves them. The main process creates the block (name None) and unlinks it at the end,
+    workers attach to it by name.
+    """
+    def __init__(self, headers: list[str], size: int, name: str = None) -> None:
+        self._headers = headers
+        self._size = size
+        dtype = getSharedResultDtype(headers)
+        self._memory = shared_memory.SharedMemory(name=name, create=name is None, size=max(size, 1) * dtype.itemsize)
+        self._rows = np.ndarray((size,), dtype=dtype, buffer=self._memory.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        self.unlink()
+
+    def getName(self) -> str:
+        return self._memory.name
+
+    def getHeaders(self) -> list[str]:
+        return self._headers
+
+    def getSize(self) -> int:
+        return self._size
+
+    def store(self, results: list[tuple[int, tuple]]) -> list[int]:
+        """
+        Writes the (index, row) results in their slots and returns their indices
+        """
+        indices = [index for index, _ in results]
+        if indices:
+            self._rows[indices] = [(index, *row[1:]) for index, row in results]
+        return indices
+
+    def storeColumns(self, indices: np.ndarray, columns: list[np.ndarray]) -> list[int]:
+        """
+        Writes the columns (one value per index, in the order of the headers after simId) in the slots indices
+        and returns the indices, without building a row per simulation
+        """
+        self._rows["simId"][indices] = indices
+        for header, column in zip(self._headers[1:], columns):
+            self._rows[header][indices] = column
+        return indices.tolist()
+
+    def read(self, indices: list[int]) -> list[tuple[int, tuple]]:
+        """
+        (index, row) results of the slots indices, rows hold python numbers like the rows of single_simulation
+        """
+        rows = self._rows[indices]
+        return list(zip(indices, zip(*(rows[header].tolist() for header in self._headers))))
+
+    def close(self):
+        # the array must not outlive the mapping it points to
+        self._rows = None
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+# shared result buffer of the current process, None when the rows are sent back to the main process
+g_shared_results: SharedResultBuffer = None
+
+
+def getSharedResults() -> SharedResultBuffer | None:
+    return g_shared_results
+
+
+def openSharedResults(headers: list[str], size: int, name: str) -> SharedResultBuffer:
+    """
+    Attaches this process to the shared result buffer name, which getSharedResults() then returns
+    """
+    global g_shared_results
+    g_shared_results = SharedResultBuffer(headers, size, name)
+    return g_shared_results
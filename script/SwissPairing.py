@@ -0,0 +1,111 @@
+from itertools import combinations
+from utils import *
+
+# candidates considered after the best unpaired team when looking for its two opponents
+SWISS_PAIRING_WINDOW = 6
+# how many matchups before/after a rematch are tried for a swap that removes it
+SWISS_REPAIR_DISTANCE = 3
+# a repeated triple costs more than any number of repeated pairs
+TRIPLE_REMATCH_COST = 100
+
+
+class SwissPairingEngine:
+    """
+    Pairs a ranked field into matchups of three while avoiding rematches.
+
+    Teams are ids 0..n-1. Past matchups are indexed incrementally (recordMatchup) as sorted id triples and
+    id pairs, so a candidate matchup is checked in O(1). Each round the best unpaired team is grouped with the two
+    candidates of its score group (a window of the next SWISS_PAIRING_WINDOW unpaired teams) leaving the fewest
+    rematches, then a bounded repair pass swaps teams between nearby matchups to remove the remaining ones.
+    """
+    _teamCount: int
+    _pastTriples: set[tuple[int, int, int]]
+    _pastPairs: set[tuple[int, int]]
+
+    def __init__(self, team_count: int, window: int = SWISS_PAIRING_WINDOW, repair_distance: int = SWISS_REPAIR_DISTANCE) -> None:
+        self._teamCount = team_count
+        self._window = window
+        self._repairDistance = repair_distance
+        self._pastTriples = set()
+        self._pastPairs = set()
+
+    def recordMatchup(self, team_ids: tuple[int, int, int]):
+        a, b, c = sorted(team_ids)
+        self._pastTriples.add((a, b, c))
+        self._pastPairs.update(((a, b), (a, c), (b, c)))
+
+    def getMatchupCost(self, team_ids: tuple[int, int, int]) -> int:
+        a, b, c = sorted(team_ids)
+        cost = TRIPLE_REMATCH_COST if (a, b, c) in self._pastTriples else 0
+        return cost + ((a, b) in self._pastPairs) + ((a, c) in self._pastPairs) + ((b, c) in self._pastPairs)
+
+    def pairRound(self, ranked_ids: list[int]) -> list[tuple[int, int, int]]:
+        """
+        Matchups for the next round, ranked_ids being the team ids best first.
+        """
+        paired = [False] * len(ranked_ids)
+        matchups = []
+        first = 0
+
+        while True:
+            while first < len(ranked_ids) and paired[first]:
+                first += 1
+
+            # the next unpaired teams after the first one form its score group
+            candidates = []
+            position = first + 1
+            while position < len(ranked_ids) and len(candidates) < self._window:
+                if not paired[position]:
+                    candidates.append(position)
+                position += 1
+
+            if len(candidates) < TEAMS_IN_ONE_MATCH - 1:
+                break
+
+            best_pair = None
+            best_cost = None
+            # pairs are tried in ranking order, the first one without rematch is kept
+            for second, third in combinations(candidates, 2):
+                cost = self.getMatchupCost((ranked_ids[first], ranked_ids[second], ranked_ids[third]))
+                if best_cost is None or cost < best_cost:
+                    best_pair, best_cost = (second, third), cost
+                    if cost == 0:
+                        break
+
+            for position in (first,) + best_pair:
+                paired[position] = True
+            matchups.append((ranked_ids[first], ranked_ids[best_pair[0]], ranked_ids[best_pair[1]]))
+
+        self._repair(matchups)
+        return matchups
+
+    def _repair(self, matchups: list[tuple[int, int, int]]):
+        """
+        Swaps one team between a matchup with rematches and a nearby matchup when it lowers their total cost.
+        """
+        costs = [self.getMatchupCost(matchup) for matchup in matchups]
+
+        for i in range(len(matchups)):
+            if costs[i] == 0:
+                continue
+
+            for j in range(max(0, i - self._repairDistance), min(len(matchups), i + self._repairDistance + 1)):
+                if j == i:
+                    continue
+
+                swapped = self._findImprovingSwap(matchups[i], matchups[j], costs[i] + costs[j])
+                if swapped is not None:
+                    matchups[i], matchups[j] = swapped
+                    costs[i] = self.getMatchupCost(matchups[i])
+                    costs[j] = self.getMatchupCost(matchups[j])
+                    if costs[i] == 0:
+                        break
+
+    def _findImprovingSwap(self, matchup: tuple[int, int, int], other: tuple[int, int, int], current_cost: int):
+        for x in range(TEAMS_IN_ONE_MATCH):
+            for y in range(TEAMS_IN_ONE_MATCH):
+                new_matchup = matchup[:x] + (other[y],) + matchup[x + 1:]
+                new_other = other[:y] + (matchup[x],) + other[y + 1:]
+                if self.getMatchupCost(new_matchup) + self.getMatchupCost(new_other) < current_cost:
+                    return new_matchup, new_other
+        return None
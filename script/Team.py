@@ -1,35 +1,141 @@
 from openskill import Rating
+import numpy as np
+from utils import *
+
+# column of each element of a score in TeamTable.getScores (see Team.get_score)
+SCORE_MATCH_VICTORIES = 0
+SCORE_CYCLE_RATE = 1
+SCORE_ROUND_RATE = 2
+SCORE_DEFENSE_RATE = 3
+# score columns compared to rank teams, most important first
+SCORE_TIEBREAK = (SCORE_MATCH_VICTORIES, SCORE_CYCLE_RATE, SCORE_ROUND_RATE, SCORE_DEFENSE_RATE)
+
+
+def _roundRates(rates: np.ndarray) -> np.ndarray:
+    """
+    Vectorized round(rate, 2) giving exactly the values of python's round.
+    np.round only disagrees with it when rate * 100 is next to a .5, those few values go through python's round.
+    """
+    rounded = np.round(rates, 2)
+    scaled = rates * 100
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(rate, 2) for rate in rates[near_half].tolist()]
+    return rounded
+
+
+def computeScores(counters: np.ndarray) -> np.ndarray:
+    """
+    Scores of counter rows (..., COUNTER_COUNT) as a (..., 4) float array, columns are the SCORE_* of Team.get_score
+    """
+    victories = counters[..., [MATCH_VICTORY_COUNTER, CYCLE_VICTORY_COUNTER, ROUND_VICTORY_COUNTER, DEFENSE_VICTORY_COUNTER]]
+    totals = np.maximum(counters[..., [MATCH_COUNTER, CYCLE_COUNTER, ROUND_COUNTER, DEFENSE_COUNTER]], 1)
+
+    scores = np.empty(victories.shape, dtype=np.float64)
+    scores[..., SCORE_MATCH_VICTORIES] = victories[..., 0]
+    scores[..., SCORE_CYCLE_RATE:] = _roundRates(victories[..., 1:] / totals[..., 1:])
+    return scores
+
+
+def rankOrderFromScores(scores: np.ndarray, tiebreak: tuple[int, ...] = SCORE_TIEBREAK) -> np.ndarray:
+    """
+    Stable order by decreasing score along the second to last axis of scores (..., k, 4),
+    comparing the score columns in the order of tiebreak
+    """
+    # lexsort is stable and uses its last key as the primary one
+    return np.lexsort(tuple(-scores[..., column] for column in reversed(tiebreak)))
+
+
+class TeamTable:
+    """
+    Struct-of-arrays storage of a field of teams: ratings and counters live in contiguous arrays indexed by team id,
+    Team objects are thin views on one row.
+    """
+    _names: list[str]
+    _ratings: list[Rating]
+    mus: np.ndarray
+    sigmas: np.ndarray
+    counters: np.ndarray
+
+    def __init__(self, names: list[str], ratings: list[Rating]) -> None:
+        assert len(names) == len(ratings)
+        self._names = names
+        self._ratings = ratings
+        self.mus = np.array([rating.mu for rating in ratings], dtype=np.float64)
+        self.sigmas = np.array([rating.sigma for rating in ratings], dtype=np.float64)
+        # one row per team, columns are the *_COUNTER statistics of utils
+        self.counters = np.zeros((len(names), COUNTER_COUNT), dtype=np.int64)
+        self._teams = None
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def getTeams(self) -> list["Team"]:
+        if self._teams is None:
+            self._teams = [Team(self._names[i], self._ratings[i], self, i) for i in range(len(self))]
+        return self._teams
+
+    def getName(self, team_id: int) -> str:
+        return self._names[team_id]
+
+    def getRating(self, team_id: int) -> Rating:
+        return self._ratings[team_id]
+
+    def addCounters(self, team_ids: np.ndarray, counters: np.ndarray):
+        """
+        Adds counter rows (k, COUNTER_COUNT) to the teams team_ids (k,), a team can appear several times.
+        """
+        np.add.at(self.counters, np.asarray(team_ids), counters)
+
+    def getScores(self, team_ids: np.ndarray = None) -> np.ndarray:
+        """
+        (k, 4) float array of the scores of team_ids (every team by default), columns are the SCORE_* of Team.get_score
+        """
+        return computeScores(self.counters if team_ids is None else self.counters[np.asarray(team_ids)])
+
+    def getScore(self, team_id: int) -> tuple[int, float, float, float]:
+        counters = self.counters[team_id].tolist()
+        return (
+            counters[MATCH_VICTORY_COUNTER],
+            round(counters[CYCLE_VICTORY_COUNTER] / (counters[CYCLE_COUNTER] if counters[CYCLE_COUNTER] > 0 else 1), 2),
+            round(counters[ROUND_VICTORY_COUNTER] / (counters[ROUND_COUNTER] if counters[ROUND_COUNTER] > 0 else 1), 2),
+            round(counters[DEFENSE_VICTORY_COUNTER] / (counters[DEFENSE_COUNTER] if counters[DEFENSE_COUNTER] > 0 else 1), 2)
+        )
+
+    def getRankOrder(self, team_ids: np.ndarray) -> np.ndarray:
+        """
+        Positions in team_ids ordered by decreasing score, teams with the same score keep their order in team_ids
+        (same result as sorted(teams, key = lambda t: t.get_score(), reverse=True)).
+        """
+        return rankOrderFromScores(self.getScores(team_ids))
+
+    def rank(self, team_ids: np.ndarray = None) -> np.ndarray:
+        """
+        Team ids ordered by decreasing score, see getRankOrder.
+        """
+        team_ids = np.arange(len(self)) if team_ids is None else np.asarray(team_ids)
+        return team_ids[self.getRankOrder(team_ids)]
+
 
 class Team:
-    _name: str
-    _matchVictoryCount = 0
-    _cycleVictoryCount = 0
-    _roundVictoryCount = 0
-    _defenseVictoryCount = 0
-    _matchCount = 0
-    _cycleCount = 0
-    _roundCount = 0
-    _defenseCount = 0
-
-    def __init__(self, name:str, rating:Rating) -> None:
-        self._name = name
-        self._rating = rating
-        self._matchVictoryCount = 0
-        self._cycleVictoryCount = 0
-        self._roundVictoryCount = 0
-        self._defenseVictoryCount = 0
-        self._matchCount = 0
-        self._cycleCount = 0
-        self._roundCount = 0
-        self._defenseCount = 0
-        pass
+    """
+    View on one row of a TeamTable. A team created on its own gets a table of its own.
+    """
+    __slots__ = ("_table", "_id")
+
+    def __init__(self, name:str, rating:Rating, table: TeamTable = None, team_id: int = 0) -> None:
+        if table is None:
+            table = TeamTable([name], [rating])
+            team_id = 0
+        self._table = table
+        self._id = team_id
 
     def __lt__(self, other):
          return self.get_rating() < other.get_rating()
-    
+
     def __gt__(self, other):
          return self.get_rating() > other.get_rating()
-    
+
     def __le__(self, other):
          return self.get_rating() <= other.get_rating()
 
@@ -40,66 +146,100 @@ class Team:
         return self.get_name()
 
     def get_name(self) -> str:
-        return self._name
-    
+        return self._table.getName(self._id)
+
+    def get_id(self) -> int:
+        return self._id
+
+    def get_table(self) -> TeamTable:
+        return self._table
+
     def get_rating_str(self) -> str:
-        return repr(self._rating)
-    
+        return repr(self.get_rating())
+
     def get_score_str(self) -> str:
         return f"{self.get_score()} (match/cycle/round/defense)"
-    
+
     def get_rating(self) -> Rating:
-        return self._rating
+        return self._table.getRating(self._id)
+
+    def _addToCounter(self, counter: int):
+        self._table.counters[self._id, counter] += 1
+
+    def addMatchVictory(self):
+        self._addToCounter(MATCH_VICTORY_COUNTER)
+
+    def addCycleVictory(self):
+        self._addToCounter(CYCLE_VICTORY_COUNTER)
 
-    def addMatchVictory(self): 
-        self._matchVictoryCount += 1
+    def addRoundVictory(self):
+        self._addToCounter(ROUND_VICTORY_COUNTER)
 
-    def addCycleVictory(self): 
-        self._cycleVictoryCount += 1
+    def addDefenseVictory(self):
+        self._addToCounter(DEFENSE_VICTORY_COUNTER)
 
-    def addRoundVictory(self): 
-        self._roundVictoryCount += 1
+    def addMatch(self):
+        self._addToCounter(MATCH_COUNTER)
 
-    def addDefenseVictory(self): 
-        self._defenseVictoryCount += 1
+    def addCycle(self):
+        self._addToCounter(CYCLE_COUNTER)
 
-    def addMatch(self): 
-        self._matchCount += 1
+    def addRound(self):
+        self._addToCounter(ROUND_COUNTER)
 
-    def addCycle(self): 
-        self._cycleCount += 1
+    def addDefense(self):
+        self._addToCounter(DEFENSE_COUNTER)
 
-    def addRound(self): 
-        self._roundCount += 1
+    def addCounters(self, counters):
+        """
+        Adds a whole row of statistics at once, indexed by the *_COUNTER columns of utils
+        """
+        self._table.counters[self._id] += counters
 
-    def addDefense(self): 
-        self._defenseCount += 1
+    def _getCounter(self, counter: int) -> int:
+        return int(self._table.counters[self._id, counter])
 
     # stat counts
     def getMatchVictoryCount(self) -> int:
-        return self._matchVictoryCount
-        
+        return self._getCounter(MATCH_VICTORY_COUNTER)
+
     def getCycleVictoryCount(self) -> int:
-        return self._cycleVictoryCount
-        
+        return self._getCounter(CYCLE_VICTORY_COUNTER)
+
     def getRoundVictoryCount(self) -> int:
-        return self._roundVictoryCount
-        
+        return self._getCounter(ROUND_VICTORY_COUNTER)
+
     def getDefenseVictoryCount(self) -> int:
-        return self._defenseVictoryCount
+        return self._getCounter(DEFENSE_VICTORY_COUNTER)
 
     #stat rates
     def getMatchVictoryRate(self) -> float:
-        return round(self._matchVictoryCount / (self._matchCount if self._matchCount > 0 else 1), 2)
-        
+        match_count = self._getCounter(MATCH_COUNTER)
+        return round(self.getMatchVictoryCount() / (match_count if match_count > 0 else 1), 2)
+
     def getCycleVictoryRate(self) -> float:
-        return round(self._cycleVictoryCount / (self._cycleCount if self._cycleCount > 0 else 1), 2)
-        
+        return self.get_score()[SCORE_CYCLE_RATE]
+
     def getRoundVictoryRate(self) -> float:
-        return round(self._roundVictoryCount / (self._roundCount if self._roundCount > 0 else 1), 2)
-        
+        return self.get_score()[SCORE_ROUND_RATE]
+
     def getDefenseVictoryRate(self) -> float:
-        return round(self._defenseVictoryCount / (self._defenseCount if self._defenseCount > 0 else 1), 2)
-        
+        return self.get_score()[SCORE_DEFENSE_RATE]
+
     def get_score(self) -> tuple[int, int, int, int]:
-        return (self.getMatchVictoryCount(), self.getCycleVictoryRate(), self.getRoundVictoryRate(), self.getDefenseVictoryRate())
+        return self._table.getScore(self._id)
+
+
+def rankTeams(teams: list[Team]) -> list[Team]:
+    """
+    Orders teams by decreasing score, with one lexsort when they all belong to the same TeamTable.
+    """
+    if len(teams) == 0:
+        return []
+
+    table = teams[0].get_table()
+    if any(team.get_table() is not table for team in teams):
+        return sorted(teams, key = lambda t: t.get_score(), reverse=True)
+
+    team_ids = np.fromiter((team.get_id() for team in teams), dtype=np.int64, count=len(teams))
+    return [teams[i] for i in table.getRankOrder(team_ids).tolist()]
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import numpy as np
+from openskill import Rating, predict_win
+from scipy.special import ndtr
+from utils import *
+from PhaseProfiler import profiledPhase
+
+# openskill default beta (sigma / 2 with sigma = 25 / 3)
+OPENSKILL_BETA = 25 / 3 / 2
+
+
+class WinProbabilityCache:
+    """
+    LRU cache in front of openskill predict_win, keyed on the ordered (mu, sigma) of each team.
+    The odds of a matchup never change during a tournament since ratings are fixed, so matches and rounds
+    asking again for the same triple are served from memory.
+    """
+    _entries: OrderedDict
+    _maxSize: int
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, max_size: int) -> None:
+        self._entries = OrderedDict()
+        self._maxSize = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def predictWin(self, ratings: tuple[Rating, ...]) -> tuple[float, ...]:
+        key = tuple((rating.mu, rating.sigma) for rating in ratings)
+        odds = self._entries.get(key)
+
+        if odds is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return odds
+
+        self.misses += 1
+        odds = tuple(predict_win(teams=[[rating] for rating in ratings]))
+
+        if self._maxSize > 0:
+            self._entries[key] = odds
+            if len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
+
+        return odds
+
+    def resize(self, max_size: int):
+        self._maxSize = max_size
+        while len(self._entries) > max(max_size, 0):
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def getSize(self) -> int:
+        return len(self._entries)
+
+    def getHitRate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def getStats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": self.getSize(), "maxSize": self._maxSize, "hitRate": self.getHitRate()}
+
+
+# one cache per process: every pool worker gets its own copy
+g_win_probability_cache = WinProbabilityCache(WIN_PROBABILITY_CACHE_SIZE)
+
+
+@profiledPhase("predict_win")
+def getWinProbabilities(teams) -> tuple[float, ...]:
+    """
+    Round win probabilities of each team of a matchup (anything with get_rating()), in matchup order.
+    """
+    return g_win_probability_cache.predictWin(tuple(team.get_rating() for team in teams))
+
+
+def getWinProbabilityCache() -> WinProbabilityCache:
+    return g_win_probability_cache
+
+
+@profiledPhase("predict_win")
+def predictWinArray(mus: np.ndarray, sigmas: np.ndarray) -> np.ndarray:
+    """
+    Vectorized openskill predict_win for one-player teams: mus and sigmas have the shape (..., 3),
+    the result has the same shape and gives the round win probability of each team of each matchup.
+    """
+    mus = np.asarray(mus, dtype=np.float64)
+    # openskill's team_rating returns sigma squared, which predict_win squares again
+    sigmas_squared = np.asarray(sigmas, dtype=np.float64) ** 2
+    team_count = mus.shape[-1]
+    pair_count = team_count * (team_count - 1) / 2
+
+    odds = np.zeros(np.broadcast_shapes(mus.shape, sigmas_squared.shape))
+    for a in range(team_count):
+        for b in range(team_count):
+            if a == b:
+                continue
+            odds[..., a] += ndtr((mus[..., a] - mus[..., b]) / np.sqrt(team_count * OPENSKILL_BETA ** 2 + sigmas_squared[..., a] ** 2 + sigmas_squared[..., b] ** 2))
+    return odds / pair_count
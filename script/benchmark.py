@@ -0,0 +1,281 @@
+"""
+Performance benchmarks with fixed seeds: one match (AlaraMatch.playMatch), one Swiss pairing (makeRound),
+the kendall tau distances, one result row saved by the main process (StreamingResultsWriter.write) and whole simulations of every format at 9, 27, 81 and 243 teams (main.single_simulation).
+
+Every case is repeated until it ran for --min-seconds, --repeats times, and reports its best throughput, then runs
+once more under tracemalloc for its peak memory. Against a baseline, --min-seconds is at least MIN_COMPARED_SECONDS
+so that an unchanged case doesn't fail at random. The results are compared to a baseline json, the run fails (exit code 1) when a
+throughput dropped by more than --max-slowdown or a peak memory grew by more than --max-memory-growth:
+
+    python benchmark.py                     # compare to benchmark_baseline.json
+    python benchmark.py --save-baseline     # record the current machine and code as the baseline
+    python benchmark.py -k Swiss --teams 27 81
+
+Simulations playing more than --max-matches matches (the round-robins of 81 and 243 teams) are skipped.
+Baselines are only comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from utils import *
+from AlaraMatch import AlaraMatch
+from Logger import NULL_LOGGER
+from RankingComparator import kendall_tau_distance, weighted_kendall_tau_distance, get_weights
+from WinProbability import getWinProbabilityCache
+from csvManager import StreamingResultsWriter, get_results_path
+from tournaments import tournamentSwissSystem
+from main import generate_teams, single_simulation, simulation_rng, estimate_match_count, get_result_headers
+from sweep import is_valid_config
+
+BENCHMARK_SEED = 20240601
+BENCHMARK_TEAMS = (9, 27, 81, 243)
+BENCHMARK_FORMATS = (1, 2, 3, 4)
+BENCHMARK_MIN_SECONDS = 1.0
+# measures of each case, the fastest one is kept: slower ones come from other load on the machine
+BENCHMARK_REPEATS = 3
+# shortest measure compared to or saved as a baseline, shorter ones vary by about as much as MAX_SLOWDOWN
+MIN_COMPARED_SECONDS = 1.0
+BENCHMARK_MAX_MATCHES = 10000
+# run folder written by the results writer case, removed before it runs
+BENCHMARK_WRITER_FOLDER = "./simulations/benchmark-writer/"
+# rows of each run written by the results writer case, a checkpoint costs more as a run grows
+BENCHMARK_WRITER_ROWS = 10000
+BASELINE_FILE = "benchmark_baseline.json"
+# a case fails when its throughput is below (1 - MAX_SLOWDOWN) * baseline or its peak memory above (1 + MAX_MEMORY_GROWTH) * baseline
+MAX_SLOWDOWN = 0.25
+MAX_MEMORY_GROWTH = 0.25
+# peak memory differences below this are noise
+MEMORY_NOISE_BYTES = 1 << 16
+
+
+def play_match_case(rng: np.random.Generator):
+    teams = generate_teams(27, rng)
+    matchups = [tuple(teams[i] for i in rng.choice(len(teams), TEAMS_IN_ONE_MATCH, replace=False)) for _ in range(256)]
+
+    def run(i: int):
+        AlaraMatch(matchups[i % len(matchups)], rng, NULL_LOGGER).playMatch()
+    return run, "matches/s"
+
+
+def make_round_case(rng: np.random.Generator):
+    # pairing of the 4th round of an 81 team Swiss system, the history of the first 3 rounds is kept
+    teams = generate_teams(81, rng)
+    tournament = tournamentSwissSystem(teams, rng, NULL_LOGGER, SWISS_ROUNDS)
+    tournament._playRound([tuple(teams[i:i + TEAMS_IN_ONE_MATCH]) for i in range(0, len(teams), TEAMS_IN_ONE_MATCH)])
+    for _ in range(2):
+        tournament._playRound(tournament.makeRound())
+
+    def run(i: int):
+        tournament.makeRound()
+    return run, "rounds/s"
+
+
+def kendall_tau_case(rng: np.random.Generator, weighted: bool):
+    teams = generate_teams(243, rng)
+    rankings = [[teams[i] for i in rng.permutation(len(teams))] for _ in range(64)]
+    weights = get_weights("hyperbolic", len(teams))
+
+    def run(i: int):
+        if weighted:
+            weighted_kendall_tau_distance(teams, rankings[i % len(rankings)], weights)
+        else:
+            kendall_tau_distance(teams, rankings[i % len(rankings)])
+    return run, "calls/s"
+
+
+def open_benchmark_writer() -> StreamingResultsWriter:
+    shutil.rmtree(get_results_path(BENCHMARK_WRITER_FOLDER, ""), ignore_errors=True)
+    return StreamingResultsWriter(get_result_headers(), BENCHMARK_WRITER_FOLDER)
+
+
+def results_writer_case(rng: np.random.Generator):
+    # rows shaped like the ones of single_simulation, buffered, summarized, flushed and checkpointed as in a run
+    # of BENCHMARK_WRITER_ROWS simulations, then the run is closed and a new one starts
+    writers = [open_benchmark_writer()]
+    taus = rng.uniform(-1, 1, 4096)
+
+    def run(i: int):
+        index = i % BENCHMARK_WRITER_ROWS
+        if index == 0 and i > 0:
+            writers[0].close()
+            writers[0] = open_benchmark_writer()
+        writers[0].write(index, (index, float(taus[i % len(taus)]), i % 97, 26, i % 5, 0))
+    return run, "rows/s"
+
+
+def tournament_case(rng: np.random.Generator, format: int, n_teams: int):
+    config = argparse.Namespace(n_teams=n_teams, format=format, rounds=SWISS_ROUNDS, weighting=None)
+    seed = int(rng.integers(2 ** 31))
+
+    def run(i: int):
+        single_simulation((i, simulation_rng(seed, i), "./simulations/", config))
+    return run, "simulations/s"
+
+
+def get_cases(teams: list[int], formats: list[int], max_matches: float) -> dict:
+    """
+    name -> function building the case from a generator, the skipped simulations are listed with None
+    """
+    cases = {
+        "playMatch": lambda rng: play_match_case(rng),
+        "makeRound-81t": lambda rng: make_round_case(rng),
+        "kendall_tau-243t": lambda rng: kendall_tau_case(rng, False),
+        "weighted_kendall_tau-243t": lambda rng: kendall_tau_case(rng, True),
+        "StreamingResultsWriter.write": lambda rng: results_writer_case(rng),
+    }
+    for format in formats:
+        for n_teams in teams:
+            config = argparse.Namespace(n_teams=n_teams, format=format, rounds=SWISS_ROUNDS, replicas=1)
+            if not is_valid_config(config):
+                continue
+            name = f"{getTournamentFormatStr(format).replace(' ', '')}-{n_teams}t"
+            cases[name] = (lambda rng, format=format, n_teams=n_teams: tournament_case(rng, format, n_teams)) if estimate_match_count(config) <= max_matches else None
+    return cases
+
+
+def measure(run, min_seconds: float) -> tuple[int, float]:
+    """
+    Calls run(0), run(1)... until min_seconds passed, returns the number of calls and their time
+    """
+    iterations = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds:
+        run(iterations)
+        iterations += 1
+        elapsed = time.perf_counter() - start
+    return iterations, elapsed
+
+
+def measure_peak_memory(run, iteration: int) -> int:
+    tracemalloc.start()
+    try:
+        run(iteration)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_best(run, min_seconds: float, repeats: int) -> tuple[int, float]:
+    """
+    Calls and time of the measure with the best throughput out of repeats, the calls go on from one measure to the next
+    """
+    best_iterations, best_seconds, offset = 0, 0.0, 0
+    for _ in range(max(repeats, 1)):
+        iterations, seconds = measure(lambda i: run(offset + i), min_seconds)
+        offset += iterations
+        if best_seconds == 0.0 or iterations / seconds > best_iterations / best_seconds:
+            best_iterations, best_seconds = iterations, seconds
+    return best_iterations, best_seconds
+
+
+def run_benchmarks(cases: dict, min_seconds: float, repeats: int = BENCHMARK_REPEATS) -> dict:
+    results = {}
+    for name, build in cases.items():
+        if build is None:
+            print(f"{name:<28} skipped, raise --max-matches to run it")
+            continue
+        # every case starts from the same state, whatever ran before it
+        getWinProbabilityCache().clear()
+        run, unit = build(np.random.default_rng(BENCHMARK_SEED))
+        iterations, seconds = measure_best(run, min_seconds, repeats)
+        results[name] = {
+            "unit": unit,
+            "throughput": iterations / seconds,
+            "iterations": iterations,
+            "seconds": seconds,
+            "repeats": repeats,
+            "peak_memory": measure_peak_memory(run, iterations),
+        }
+        print(f"{name:<28} {results[name]['throughput']:>12.2f} {unit:<14} {results[name]['peak_memory'] / 2 ** 20:>9.2f} MiB")
+    return results
+
+
+def get_environment() -> dict:
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "cpus": os.cpu_count(), "match_engine": MATCH_ENGINE}
+
+
+def compare_to_baseline(results: dict, baseline: dict, max_slowdown: float, max_memory_growth: float) -> list[str]:
+    """
+    Prints every case next to its baseline and returns the regressions
+    """
+    regressions = []
+    print(f"\n{'case':<28} {'throughput':>10} {'memory':>10}")
+    for name, result in results.items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            print(f"{name:<28} {'new':>10}")
+            continue
+
+        speed = result["throughput"] / reference["throughput"] - 1
+        memory = result["peak_memory"] / max(reference["peak_memory"], 1) - 1
+        print(f"{name:<28} {speed:>+10.1%} {memory:>+10.1%}")
+        if speed < -max_slowdown:
+            regressions.append(f"{name}: {result['throughput']:.2f} {result['unit']}, baseline {reference['throughput']:.2f} ({speed:+.1%})")
+        if memory > max_memory_growth and result["peak_memory"] - reference["peak_memory"] > MEMORY_NOISE_BYTES:
+            regressions.append(f"{name}: peak memory {result['peak_memory']} bytes, baseline {reference['peak_memory']} ({memory:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # only runs the cases whose name contains one of these
+    parser.add_argument('-k', '--cases', type=str, nargs='*', default=None)
+    parser.add_argument('--teams', type=int, nargs='*', default=list(BENCHMARK_TEAMS))
+    parser.add_argument('--formats', type=int, nargs='*', default=list(BENCHMARK_FORMATS))
+    parser.add_argument('--min-seconds', type=float, default=BENCHMARK_MIN_SECONDS)
+    parser.add_argument('--repeats', type=int, default=BENCHMARK_REPEATS)
+    parser.add_argument('--max-matches', type=float, default=BENCHMARK_MAX_MATCHES)
+    parser.add_argument('--baseline', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--max-slowdown', type=float, default=MAX_SLOWDOWN)
+    parser.add_argument('--max-memory-growth', type=float, default=MAX_MEMORY_GROWTH)
+    # also saves the results in this json file
+    parser.add_argument('-o', '--output', type=str, default=None)
+    benchmark_args = parser.parse_args()
+
+    cases = get_cases(benchmark_args.teams, benchmark_args.formats, benchmark_args.max_matches)
+    if benchmark_args.cases is not None:
+        cases = {name: build for name, build in cases.items() if any(pattern in name for pattern in benchmark_args.cases)}
+
+    min_seconds = benchmark_args.min_seconds
+    if (benchmark_args.save_baseline or os.path.exists(benchmark_args.baseline)) and min_seconds < MIN_COMPARED_SECONDS:
+        print(f"--min-seconds raised to {MIN_COMPARED_SECONDS} to compare to the baseline")
+        min_seconds = MIN_COMPARED_SECONDS
+
+    report = {"environment": get_environment(), "cases": run_benchmarks(cases, min_seconds, benchmark_args.repeats)}
+    if benchmark_args.output is not None:
+        with open(benchmark_args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if benchmark_args.save_baseline:
+        baseline = {"environment": report["environment"], "cases": {}}
+        if os.path.exists(benchmark_args.baseline):
+            with open(benchmark_args.baseline) as file:
+                baseline = json.load(file)
+        # cases that didn't run keep their previous baseline
+        baseline["environment"] = report["environment"]
+        baseline["cases"].update(report["cases"])
+        with open(benchmark_args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2)
+        print(f"Baseline saved in {benchmark_args.baseline}")
+    elif os.path.exists(benchmark_args.baseline):
+        with open(benchmark_args.baseline) as file:
+            baseline = json.load(file)
+        if baseline["environment"] != report["environment"]:
+            print("The baseline was recorded in another environment:", baseline["environment"])
+        regressions = compare_to_baseline(report["cases"], baseline, benchmark_args.max_slowdown, benchmark_args.max_memory_growth)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("\nNo regression")
+    else:
+        print(f"No baseline in {benchmark_args.baseline}, save one with --save-baseline")
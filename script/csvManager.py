@@ -1,9 +1,33 @@
 import csv
+import json
 import os
+import numpy as np
+from RunningStatistics import RunSummary
+from PhaseProfiler import profiledPhase, getProfiler
 
-def results_to_csv(results, headers: list[str], folder: str):
-    csv_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder + "/final_results.csv")
-    csv_file = os.path.normpath(csv_file) # normalize path separators
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+RUN_CONFIG_FILE_NAME = "run.json"
+# the columns of X.csv are saved as one .npy file per column in the folder X.columns/
+COLUMNS_FOLDER_SUFFIX = ".columns"
+# streaming statistics of X.csv are saved in X.summary.json
+SUMMARY_FILE_SUFFIX = ".summary.json"
+RESULT_COLUMN_DTYPES = {
+    "simId": np.int64,
+    "kendalTauDistance": np.float64,
+    "disagreement": np.int64,
+    "matchCount": np.int64,
+    "tieCount": np.int64,
+    "completeDuplicateMatches": np.int64,
+    "weightedKendalTauDistance": np.float64,
+    "weightedDisagreement": np.float64,
+}
+
+def get_results_path(folder: str, file_name: str) -> str:
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), folder + "/" + file_name)
+    return os.path.normpath(path) # normalize path separators
+
+def results_to_csv(results, headers: list[str], folder: str, columnar: bool = False):
+    csv_file = get_results_path(folder, "final_results.csv")
     csv_folder = os.path.dirname(csv_file)
     
     if not os.path.exists(csv_folder):
@@ -12,4 +36,253 @@ def results_to_csv(results, headers: list[str], folder: str):
     with open(csv_file, 'w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(headers)
-        writer.writerows(results)
\ No newline at end of file
+        writer.writerows(results)
+
+    if columnar:
+        results_to_columns(results, headers, get_columns_folder(csv_file))
+
+
+def get_columns_folder(csv_file: str) -> str:
+    return os.path.splitext(csv_file)[0] + COLUMNS_FOLDER_SUFFIX
+
+def _column_to_array(header: str, values: list) -> np.ndarray:
+    try:
+        return np.array(values, dtype=RESULT_COLUMN_DTYPES.get(header, np.float64))
+    except ValueError: # e.g. the hex simIds of older runs
+        return np.array(values, dtype=str)
+
+def results_to_columns(results, headers: list[str], columns_folder: str):
+    """
+    Saves every column of results as columns_folder/<header>.npy
+    """
+    os.makedirs(columns_folder, exist_ok=True)
+    columns = list(zip(*results)) if len(results) > 0 else [()] * len(headers)
+    for header, values in zip(headers, columns):
+        np.save(os.path.join(columns_folder, header + ".npy"), _column_to_array(header, list(values)))
+
+def csv_to_columns(csv_file: str) -> str:
+    """
+    Converts a results csv to its columnar form (rows keep the file order) and returns the columns folder
+    """
+    headers, results = _read_csv_rows(csv_file)
+
+    columns_folder = get_columns_folder(csv_file)
+    results_to_columns(results, headers, columns_folder)
+    return columns_folder
+
+def _has_current_columns(csv_file: str) -> bool:
+    """
+    True when the columnar copy of a results csv exists and isn't older than the csv
+    """
+    columns_folder = get_columns_folder(csv_file)
+    column_files = [name for name in os.listdir(columns_folder) if name.endswith(".npy")] if os.path.isdir(columns_folder) else []
+    return len(column_files) > 0 and os.path.getmtime(csv_file) <= min(os.path.getmtime(os.path.join(columns_folder, name)) for name in column_files)
+
+def load_result_columns(csv_file: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """
+    Memory-mapped columns of a results csv, all of them by default. Only the requested columns are opened and their
+    data is read from disk when it is used. The columnar copy is (re)built from the csv when it is missing or older.
+    """
+    columns_folder = get_columns_folder(csv_file)
+    if not _has_current_columns(csv_file):
+        csv_to_columns(csv_file)
+
+    if columns is None:
+        columns = [name[:-4] for name in os.listdir(columns_folder) if name.endswith(".npy")]
+    return {column: np.load(os.path.join(columns_folder, column + ".npy"), mmap_mode='r') for column in columns}
+
+
+def read_result_columns(csv_file: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """
+    Columns of a results csv like load_result_columns, without writing anything: the columnar copy is used when it
+    is up to date, the csv is read in memory otherwise
+    """
+    if _has_current_columns(csv_file):
+        return load_result_columns(csv_file, columns)
+
+    headers, rows = _read_csv_rows(csv_file)
+    values = list(zip(*rows)) if len(rows) > 0 else [()] * len(headers)
+    return {header: _column_to_array(header, list(column)) for header, column in zip(headers, values) if columns is None or header in columns}
+
+
+def _write_json_atomically(path: str, data):
+    """
+    Replaces path with data in one step, readers see the old or the new file but never a partial one
+    """
+    temporary_file = path + ".tmp"
+    with open(temporary_file, 'w') as file:
+        # dumps encodes in one C call, dump streams the pieces through the python encoder
+        file.write(json.dumps(data))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_file, path)
+
+
+def get_summary_path(csv_file: str) -> str:
+    return os.path.splitext(csv_file)[0] + SUMMARY_FILE_SUFFIX
+
+def _read_csv_rows(csv_file: str) -> tuple[list[str], list[list[str]]]:
+    with open(csv_file, newline='') as file:
+        reader = csv.reader(file)
+        headers = next(reader)
+        return headers, [row for row in reader if row]
+
+def summarize_csv(csv_file: str) -> dict:
+    """
+    Builds and saves the summary of a results csv (see RunningStatistics.RunSummary), rows are taken in file order
+    """
+    headers, rows = _read_csv_rows(csv_file)
+    summary = RunSummary(headers)
+    for row in rows:
+        summary.add(row)
+    _write_json_atomically(get_summary_path(csv_file), summary.toDict())
+    return summary.toDict()
+
+def read_summary(csv_file: str) -> dict | None:
+    """
+    Summary of a results csv, None when there is none or when the csv changed after it was saved
+    """
+    summary_file = get_summary_path(csv_file)
+    if not os.path.exists(summary_file) or os.path.getmtime(summary_file) < os.path.getmtime(csv_file):
+        return None
+    with open(summary_file) as file:
+        return json.load(file)
+
+
+def _indices_to_ranges(indices) -> list[list[int]]:
+    ranges = []
+    for index in sorted(indices):
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+def read_checkpoint(folder: str) -> set[int]:
+    """
+    Indices of the simulations already saved in the final_results.csv of folder (empty if there is no checkpoint)
+    """
+    checkpoint_file = get_results_path(folder, CHECKPOINT_FILE_NAME)
+    if not os.path.exists(checkpoint_file):
+        return set()
+
+    with open(checkpoint_file) as file:
+        checkpoint = json.load(file)
+    return {index for start, end in checkpoint["completed"] for index in range(start, end + 1)}
+
+
+def read_completed_indices(folder: str) -> set[int]:
+    """
+    Indices of the simulations of folder whose row is in final_results.csv, checkpointed or not.
+    simId must be the simulation index. A row cut by an interrupted write is removed from the file.
+    """
+    csv_file = get_results_path(folder, "final_results.csv")
+    completed = read_checkpoint(folder)
+    if not os.path.exists(csv_file):
+        return completed
+
+    with open(csv_file, 'rb+') as file:
+        content = file.read()
+        if content and not content.endswith(b"\n"):
+            file.truncate(content.rfind(b"\n") + 1)
+            content = content[:content.rfind(b"\n") + 1]
+
+    rows = csv.reader(content.decode().splitlines()[1:])
+    return completed | {int(row[0]) for row in rows if row}
+
+def write_run_config(folder: str, config: dict):
+    run_config_file = get_results_path(folder, RUN_CONFIG_FILE_NAME)
+    os.makedirs(os.path.dirname(run_config_file), exist_ok=True)
+    with open(run_config_file, 'w') as file:
+        json.dump(config, file, indent=2)
+
+def read_run_config(folder: str) -> dict:
+    with open(get_results_path(folder, RUN_CONFIG_FILE_NAME)) as file:
+        return json.load(file)
+
+
+class StreamingResultsWriter:
+    """
+    Appends results to final_results.csv as they arrive instead of writing them all at the end.
+
+    Rows are buffered and written every buffer_size rows. Every checkpoint_every rows the file is fsynced and
+    checkpoint.json is atomically replaced with the (range compressed) indices of the simulations written so far,
+    so an interrupted run keeps everything up to its last checkpoint.
+    The summary of the rows (RunSummary) is updated one array per column with every checkpoint and whenever it is read,
+    and saved in final_results.summary.json with every checkpoint.
+    """
+    def __init__(self, headers: list[str], folder: str, buffer_size: int = 100, checkpoint_every: int = 1000):
+        self._csvFile = get_results_path(folder, "final_results.csv")
+        self._checkpointFile = get_results_path(folder, CHECKPOINT_FILE_NAME)
+        self._bufferSize = buffer_size
+        self._checkpointEvery = checkpoint_every
+        self._buffer: list[tuple] = []
+        self._bufferedIndices: list[int] = []
+        self._completed: set[int] = read_completed_indices(folder)
+        self._rowsSinceCheckpoint = 0
+
+        csv_folder = os.path.dirname(self._csvFile)
+        if not os.path.exists(csv_folder):
+            os.makedirs(csv_folder)
+
+        self._summary = RunSummary(headers)
+        is_new_file = not os.path.exists(self._csvFile) or os.path.getsize(self._csvFile) == 0
+        if not is_new_file:
+            # a resumed run goes on with the statistics of the rows already saved
+            for row in _read_csv_rows(self._csvFile)[1]:
+                self._summary.add(row)
+            self._summary.update()
+
+        self._file = open(self._csvFile, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if is_new_file:
+            self._writer.writerow(headers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def getCompletedCount(self) -> int:
+        return len(self._completed) + len(self._bufferedIndices)
+
+    def getSummary(self) -> RunSummary:
+        return self._summary
+
+    def write(self, index: int, row: tuple):
+        self._summary.add(row)
+        self._buffer.append(row)
+        self._bufferedIndices.append(index)
+        self._rowsSinceCheckpoint += 1
+
+        if self._rowsSinceCheckpoint >= self._checkpointEvery:
+            self.checkpoint()
+        elif len(self._buffer) >= self._bufferSize:
+            self.flush()
+
+    @profiledPhase("io")
+    def flush(self):
+        self._writer.writerows(self._buffer)
+        self._file.flush()
+        self._completed.update(self._bufferedIndices)
+        self._buffer = []
+        self._bufferedIndices = []
+
+    def checkpoint(self):
+        """
+        Makes every row written so far durable and records their indices and summary.
+        """
+        self.flush()
+        self._summary.update()
+        with getProfiler().measure("io"):
+            os.fsync(self._file.fileno())
+            _write_json_atomically(self._checkpointFile, {"rows": len(self._completed), "completed": _indices_to_ranges(self._completed)})
+            _write_json_atomically(get_summary_path(self._csvFile), self._summary.toDict())
+        self._rowsSinceCheckpoint = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.checkpoint()
+        self._file.close()
@@ -10,15 +10,24 @@ The setup for this example is:
 How to modelize players incentive depending on te tournament state
 """
 import argparse
+import contextlib
+import math
 import multiprocessing
 import datetime
-import uuid
-from Team import Team # we represent a team with a name and a rating
+import queue
+from Team import Team, TeamTable # we represent a team with a name and a rating, stored in a TeamTable
 from tournaments import *
 from utils import *
-from RankingComparator import kendall_tau_distance
-from Logger import Logger
+from RankingComparator import kendall_tau_distance, weighted_kendall_tau_distance, get_weights, WEIGHT_FAMILIES
+from Logger import createLogger, startLogListener, stopLogListener, initWorkerLogging
 from csvManager import *
+from WinProbability import getWinProbabilityCache
+from ReplicaSimulation import ReplicaSimulation, REPLICA_FORMATS
+from RunningStatistics import RunningStatistics
+from RunCatalog import RunCatalog
+from RoundTrace import openRoundTrace, getRoundTrace
+from SharedResults import SharedResultBuffer, openSharedResults, getSharedResults
+from PhaseProfiler import profiledPhase, startProfiling, getProfiler, mergeProfiles, formatProfileTable
 
 from openskill import Rating
 import numpy as np
@@ -30,11 +39,84 @@ parser.add_argument('-n', '--n-simulations', type=int, default=10000)
 parser.add_argument('-p', '--pools', type=int, default=4)
 parser.add_argument('-t', '--n-teams', type=int, default=27)
 parser.add_argument('-f', '--format', type=int, default=3) # 1-single knockout, 2-round robin, 3-Swiss system, 4-custom
-args = parser.parse_args()
+# rounds played by the Swiss system
+parser.add_argument('--rounds', type=int, default=SWISS_ROUNDS)
+# size of the per-worker LRU cache of matchup odds, 0 disables it
+parser.add_argument('--win-cache-size', type=int, default=WIN_PROBABILITY_CACHE_SIZE)
+# simulations played together as arrays by each task, single knockout and round robin only
+parser.add_argument('-r', '--replicas', type=int, default=1)
+# also score every simulation with a weighted kendall tau (adds two columns to the results)
+parser.add_argument('-w', '--weighting', choices=list(WEIGHT_FAMILIES.keys()), default=None)
+# simulations played by one task, by default enough for about TASK_MATCHES matches
+parser.add_argument('--chunksize', type=int, default=None)
+# how the workers are started, forkserver starts them from a process that already imported the simulation modules
+parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(), default=None)
+# results are appended to the csv every --buffer-size rows and made durable every --checkpoint-every rows
+parser.add_argument('--buffer-size', type=int, default=100)
+parser.add_argument('--checkpoint-every', type=int, default=1000)
+# workers write their rows in a shared memory block (8 bytes per column and simulation) instead of sending them back
+parser.add_argument('--shared-results', action='store_true')
+# also saves the results as one memory-mappable .npy file per column (final_results.columns/, see load_result_columns)
+parser.add_argument('--columnar', action='store_true')
+# simulation i is always played with child seed i of --seed (the current timestamp by default)
+parser.add_argument('-s', '--seed', type=int, default=None)
+# finishes the run saved in a simulation folder: its settings are reloaded and only missing simulations are played
+parser.add_argument('--resume', type=str, default=None)
+# stops once the 95% confidence interval of the mean kendall tau distance is narrower than +/- target, -n becomes a maximum
+parser.add_argument('--target-ci', type=float, default=None)
+parser.add_argument('--min-simulations', type=int, default=200)
+# records every round played in <run folder>traces/, one binary file per worker (see RoundTrace.loadRoundTraces)
+parser.add_argument('--trace', action='store_true')
+# times the phases of the simulations in every process and reports them at the end (<run folder>profile.json),
+# --cprofile also saves the cProfile stats of every process in <run folder>profile/
+parser.add_argument('--profile', action='store_true')
+parser.add_argument('--cprofile', action='store_true')
+# parsed when main.py is run, so the simulation functions can be imported (see sweep.py)
+args = None
 
 g_folder_name = "./simulations/"
+# thread writing the logs of the workers, started in __main__ when DISPLAY_LOGS is on
+g_log_listener = None
+# settings of a run, saved with its results so it can be resumed
+RUN_CONFIG_KEYS = ("n_simulations", "n_teams", "format", "rounds", "seed", "replicas", "weighting", "target_ci", "min_simulations")
+# tasks submitted per worker and not yet returned when running until a target precision
+TASKS_IN_FLIGHT_PER_WORKER = 2
+# simulations are grouped in tasks of about this many matches, so short simulations don't wait on IPC
+TASK_MATCHES = 2048
+MAX_TASK_SIZE = 256
+# but every worker gets at least this many tasks, so a small run is still spread over the pool
+MIN_TASKS_PER_WORKER = 4
+# imported by the forkserver before it forks the workers, this module imports every dependency of a simulation
+FORKSERVER_PRELOAD = ["main"]
 
 
+def get_result_headers(weighting: str = None) -> list[str]:
+    headers = ["simId", "kendalTauDistance", "disagreement", "matchCount", "tieCount", "completeDuplicateMatches"]
+    if weighting is not None:
+        headers += ["weightedKendalTauDistance", "weightedDisagreement"]
+    return headers
+
+
+def get_run_folder_name(config, root: str = "./simulations/", timestamped: bool = True) -> str:
+    """
+    <date>-<n>s-<teams>t-<format>/ folder of a run, Swiss runs not using the default round count get a -<rounds>r suffix
+    """
+    name = f"{config.n_simulations}s-{config.n_teams}t-{getTournamentFormatStr(config.format).replace(' ', '')}"
+    if config.format == 3 and config.rounds != SWISS_ROUNDS:
+        name += f"-{config.rounds}r"
+    if timestamped:
+        name = f"{datetime.datetime.now().strftime('%Y%m%d_%H-%M-%S')}-{name}"
+    return f"{root}{name}/"
+
+
+def simulation_rng(seed: int, simulation_index: int) -> np.random.Generator:
+    """
+    Generator of simulation simulation_index, the same child of seed as SeedSequence(seed).spawn(n)[simulation_index]
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(simulation_index,)))
+
+
+@profiledPhase("generate_teams")
 def generate_teams(n: int, rng_generator: np.random.Generator) -> list[Team]:
     """
     In this case, a team is represented by a openskill Rating
@@ -45,7 +127,7 @@ def generate_teams(n: int, rng_generator: np.random.Generator) -> list[Team]:
     - 0.1 is the standard deviation of an individual players skill
     """
     mus = rng_generator.normal(25, 25 / 3, n)
-    return [Team("Team %3d" % (i), Rating(mus[i], 0.1)) for i in range(n)]
+    return TeamTable(["Team %3d" % (i) for i in range(n)], [Rating(mus[i], 0.1) for i in range(n)]).getTeams()
 
 def predict_result(teams: list[Team], display = True):
     ordered = teams.copy()
@@ -57,24 +139,34 @@ def predict_result(teams: list[Team], display = True):
 
     return ordered
 
-def single_simulation(input: tuple[np.random.Generator, str]):
-    simulation_uid = uuid.uuid4().hex
+@profiledPhase("simulation")
+def single_simulation(input: tuple[int, np.random.Generator, str, argparse.Namespace]):
+    """
+    Plays simulation input[0] with the generator input[1], input[3] holds the n_teams, format, rounds and weighting to use
+    """
+    simulation_index = input[0]
+    config = input[3]
+    input = input[1:]
+    simulation_uid = str(simulation_index)
 
     simulation_log_file = f"{input[1]}logs/{simulation_uid}.log"
 
     #print(simulation_log_file)
-    logger = Logger(simulation_uid, filepath=simulation_log_file)
-    teams = generate_teams(args.n_teams, input[0])
+    logger = createLogger(simulation_uid, filepath=simulation_log_file)
+    trace = getRoundTrace()
+    if trace is not None:
+        trace.setSimulation(simulation_index)
+    teams = generate_teams(config.n_teams, input[0])
     predicted_ranking = predict_result(teams, False)
     logger.logRanking("Predicted", predicted_ranking)
 
     # playedTournament = TournamentSingleKnockout(teams, input[0], logger)
     playedTournament = None
 
-    match args.format:
+    match config.format:
         case 1: playedTournament = TournamentSingleKnockout(teams, input[0], logger)
         case 2: playedTournament = tournamentRoundRobin(teams, input[0], logger)
-        case 3: playedTournament = tournamentSwissSystem(teams, input[0], logger, 8)
+        case 3: playedTournament = tournamentSwissSystem(teams, input[0], logger, config.rounds)
         case 4: playedTournament = tournamentCustom(teams, input[0], logger)
     
     # Returns winner but currently ignored
@@ -83,41 +175,299 @@ def single_simulation(input: tuple[np.random.Generator, str]):
     tie_count = playedTournament.getTieCount()
     complete_duplicate_match_count = playedTournament.getCompleteDuplicateMatchupCount()
     kt_ranking_distance = kendall_tau_distance(predicted_ranking, resulting_ranking)
+    if trace is not None:
+        # pool workers are terminated without running exit handlers, every simulation is written when it ends
+        trace.flush()
 
     logger.logRanking("Resulting", resulting_ranking)
-    logger.logInfoMessage(f"Kendall Tau Distance: {kt_ranking_distance}")
+    logger.logInfoMessage("Kendall Tau Distance: %s", kt_ranking_distance)
+    if logger.isEnabled():
+        logger.logInfoMessage("Win probability cache: %s", getWinProbabilityCache().getStats())
 
-    return simulation_uid, *kt_ranking_distance, match_count, tie_count, complete_duplicate_match_count
+    if config.weighting is not None:
+        # the discordant weight sum is an int 0 when no pair disagrees, written as floats like the replica and shared buffer rows
+        weighted_kt_ranking_distance = tuple(float(value) for value in weighted_kendall_tau_distance(predicted_ranking, resulting_ranking, get_weights(config.weighting, config.n_teams)))
+        return simulation_index, (simulation_uid, *kt_ranking_distance, match_count, tie_count, complete_duplicate_match_count, *weighted_kt_ranking_distance)
 
+    return simulation_index, (simulation_uid, *kt_ranking_distance, match_count, tie_count, complete_duplicate_match_count)
+
+
+@profiledPhase("simulation")
+def replica_simulation(input: tuple[int, int, argparse.Namespace]):
+    """
+    Plays input[1] replicas, numbered from the simulation index input[0], with the settings input[2].
+    A batch is played with the generator of its first simulation, so a resumed batch gives the same rows again.
+    Returns the results like store_results.
+    """
+    config = input[2]
+    replicated_tournament = ReplicaSimulation(config.format, config.n_teams, input[1], simulation_rng(config.seed, input[0]), input[0])
+    replicated_tournament.play()
+    if getRoundTrace() is not None:
+        getRoundTrace().flush()
+    weights = get_weights(config.weighting, config.n_teams) if config.weighting is not None else None
+    shared_results = getSharedResults()
+    if shared_results is not None:
+        # the result columns of the batch are written as they are, without a row per replica
+        return shared_results.storeColumns(np.arange(input[0], input[0] + input[1]), replicated_tournament.getResultColumns(weights))
+    return [(input[0] + k, (str(input[0] + k), *result)) for k, result in enumerate(replicated_tournament.getResults(weights))]
+
+
+def init_worker(log_queue, config: argparse.Namespace, folder: str, shared_results_name: str):
+    """
+    Pool initializer: everything a worker needs is given here, nothing is inherited from the main process,
+    so the workers also work when they are spawned
+    """
+    if log_queue is not None:
+        initWorkerLogging(log_queue)
+    if config is None:
+        return
+    if shared_results_name is not None:
+        openSharedResults(get_result_headers(config.weighting), config.n_simulations, shared_results_name)
+    getWinProbabilityCache().resize(config.win_cache_size)
+    if config.trace:
+        openRoundTrace(folder)
+    if config.profile:
+        startProfiling(folder, config.cprofile)
+
+
+def create_pool(pools: int, log_listener = None, config: argparse.Namespace = None, folder: str = None, shared_results: SharedResultBuffer = None):
+    """
+    Pool whose workers send their logs to log_listener (see Logger.startLogListener) and are set up with the settings
+    of a main.py run (win probability cache size, --trace, --profile, --start-method) for the run folder.
+    With shared_results, the tasks write their rows in this buffer and return their indices (see store_results).
+    A profiled pool must be closed and joined before it is left, so its workers exit normally and save their profile.
+    """
+    start_method = getattr(config, "start_method", None)
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        # the server imports the simulation modules once, every worker is forked from it
+        context.set_forkserver_preload(FORKSERVER_PRELOAD)
+    return context.Pool(pools, initializer=init_worker, initargs=(log_listener.queue if log_listener is not None else None, config, folder,
+                                                                  shared_results.getName() if shared_results is not None else None))
+
+
+@contextlib.contextmanager
+def create_run_pool(config: argparse.Namespace, folder: str):
+    """
+    Pool of a main.py run and its shared result buffer (None without --shared-results), released with the pool
+    """
+    shared_results = SharedResultBuffer(get_result_headers(config.weighting), config.n_simulations) if config.shared_results else None
+    try:
+        with create_pool(config.pools, g_log_listener, config, folder, shared_results) as p:
+            yield p, shared_results
+    finally:
+        if shared_results is not None:
+            shared_results.close()
+            shared_results.unlink()
 
-def run_simulations(n, pools):
-    global g_folder_name
-    now = datetime.datetime.now()
-    ss = np.random.SeedSequence(int(round(now.timestamp())))
-    seeds = ss.spawn(n)
-    streams = [(np.random.default_rng(seed), g_folder_name) for seed in seeds]
-    
 
+def store_results(results: list[tuple[int, tuple]]) -> list:
+    """
+    Results of a task as they are sent back to the main process: only their indices when this worker
+    writes them in a shared result buffer, see load_results
+    """
+    shared_results = getSharedResults()
+    return shared_results.store(results) if shared_results is not None else results
+
+
+def load_results(results: list, shared_results: SharedResultBuffer = None) -> list[tuple[int, tuple]]:
+    """
+    (index, row) results of a task returned by store_results
+    """
+    return shared_results.read(results) if shared_results is not None else results
+
+
+def estimate_match_count(config: argparse.Namespace) -> float:
+    """
+    Matches played by one simulation of config, used to size and balance the tasks
+    """
+    n = config.n_teams
+    match config.format:
+        case 1: return (n - 1) / 2
+        case 2: return math.comb(n, TEAMS_IN_ONE_MATCH)
+        case 3: return config.rounds * n / TEAMS_IN_ONE_MATCH
+        case 4: return SWISS_ROUNDS * n / TEAMS_IN_ONE_MATCH + (TEAMS_IN_ONE_MATCH ** 2 - 1) / 2
+    return 1
+
+
+def get_task_size(config: argparse.Namespace, count: int) -> int:
+    """
+    Simulations played by one task when count simulations are left: --chunksize, or enough simulations
+    for about TASK_MATCHES matches
+    """
+    if config.chunksize is not None:
+        return config.chunksize
+    balanced = math.ceil(count / (MIN_TASKS_PER_WORKER * config.pools))
+    return max(1, min(MAX_TASK_SIZE, balanced, round(TASK_MATCHES / estimate_match_count(config))))
+
+
+def simulation_chunk(input: tuple[list[int], str, argparse.Namespace]) -> list[tuple]:
+    """
+    Plays the simulations input[0] of the run saved in the folder input[1] with the settings input[2],
+    each one with the generator simulation_rng(seed, index)
+    """
+    indices, folder, config = input
+    return store_results([single_simulation((i, simulation_rng(config.seed, i), folder, config)) for i in indices])
+
+def get_simulation_tasks(config: argparse.Namespace, folder: str, completed: set[int] = frozenset()) -> list[tuple]:
+    missing = [i for i in range(config.n_simulations) if i not in completed]
+    task_size = get_task_size(config, len(missing))
+    return [(missing[start:start + task_size], folder, config) for start in range(0, len(missing), task_size)]
+
+
+def get_replica_tasks(config: argparse.Namespace, completed: set[int] = frozenset()) -> list[tuple]:
+    n = config.n_simulations
+    return [(start, min(config.replicas, n - start), config) for start in range(0, n, config.replicas)
+            if any(i not in completed for i in range(start, min(start + config.replicas, n)))]
+
+
+def is_precise_enough(statistics: RunningStatistics, config: argparse.Namespace) -> bool:
+    return statistics.getCount() >= config.min_simulations and statistics.getConfidenceHalfWidth() <= config.target_ci
+
+
+def run_until_precise(function, tasks, config: argparse.Namespace, folder: str, writer: StreamingResultsWriter, completed: set[int] = frozenset()) -> RunningStatistics:
+    """
+    Submits tasks (function returns the results of a task with store_results) with a bounded number of them in flight.
+    No new task is submitted once the confidence interval of the mean kendall tau distance (from the summary
+    of the writer) is narrower than config.target_ci (after config.min_simulations), the tasks in flight are still saved.
+    """
+    summary = writer.getSummary()
+    # the callbacks run in a thread of the pool, results are handed to the main thread through this queue
+    returned = queue.SimpleQueue()
+    max_in_flight = TASKS_IN_FLIGHT_PER_WORKER * config.pools
+    in_flight = 0
+    task_iterator = iter(tasks)
+    # a resumed run may already be precise enough
+    dispatching = not is_precise_enough(summary.getColumn("kendalTauDistance"), config)
+
+    with create_run_pool(config, folder) as (p, shared_results):
+        with tqdm(total=config.n_simulations, initial=summary.getCount()) as progress:
+            while True:
+                while dispatching and in_flight < max_in_flight:
+                    task = next(task_iterator, None)
+                    if task is None:
+                        dispatching = False
+                        break
+                    p.apply_async(function, (task,), callback=returned.put, error_callback=returned.put)
+                    in_flight += 1
+
+                if in_flight == 0:
+                    break
+
+                results = returned.get()
+                in_flight -= 1
+                if isinstance(results, BaseException):
+                    raise results
+
+                results = [(index, row) for index, row in load_results(results, shared_results) if index not in completed]
+                for index, row in results:
+                    writer.write(index, row)
+                progress.update(len(results))
+
+                # getColumn adds the rows written since the last check to the summary
+                if is_precise_enough(summary.getColumn("kendalTauDistance"), config):
+                    dispatching = False
+            p.close()
+            p.join()
+
+    return summary.getColumn("kendalTauDistance")
+
+
+def run_replica_simulations(config: argparse.Namespace, folder: str, writer: StreamingResultsWriter, completed: set[int] = frozenset()):
+    remaining = config.n_simulations - len(completed)
+
+    with create_run_pool(config, folder) as (p, shared_results):
+        with tqdm(total=remaining) as progress:
+            for batch_results in p.imap_unordered(replica_simulation, get_replica_tasks(config, completed), chunksize=max(1, get_task_size(config, remaining) // config.replicas)):
+                batch_results = [(index, row) for index, row in load_results(batch_results, shared_results) if index not in completed]
+                for index, row in batch_results:
+                    writer.write(index, row)
+                progress.update(len(batch_results))
+        p.close()
+        p.join()
+
+
+def run_simulations(config: argparse.Namespace, folder: str, writer: StreamingResultsWriter = None, completed: set[int] = frozenset()):
     if DEBUG_MODE:
-        return single_simulation(streams[0])
+        if config.trace:
+            openRoundTrace(folder)
+        return single_simulation((0, simulation_rng(config.seed, 0), folder, config))[1]
     else:
-        with multiprocessing.Pool(pools) as p:
-            return list(tqdm(p.imap(single_simulation, streams), total=len(streams)))
+        with create_run_pool(config, folder) as (p, shared_results):
+            with tqdm(total=config.n_simulations - len(completed)) as progress:
+                # results come back in completion order and are written as they arrive
+                for results in p.imap_unordered(simulation_chunk, get_simulation_tasks(config, folder, completed)):
+                    results = load_results(results, shared_results)
+                    for index, row in results:
+                        writer.write(index, row)
+                    progress.update(len(results))
+            p.close()
+            p.join()
 
 
 if __name__ == "__main__":
+    args = parser.parse_args()
+    completed = set()
+    if args.resume is not None:
+        g_folder_name = args.resume if args.resume.endswith("/") else args.resume + "/"
+        for key, value in read_run_config(g_folder_name).items():
+            setattr(args, key, value)
+        completed = read_completed_indices(g_folder_name)
+    elif args.seed is None:
+        args.seed = int(round(datetime.datetime.now().timestamp()))
+
     if DEBUG_MODE:
         print("Running one simulation, at " + datetime.datetime.now().isoformat())
+    elif args.resume is not None:
+        print("Resuming %5d of %5d simulations for %2d team (seed %d)" % (args.n_simulations - len(completed), args.n_simulations, args.n_teams, args.seed))
     else:
-        print("Running %5d simulations for %2d team" % (args.n_simulations, args.n_teams))
+        print("Running %5d simulations for %2d team (seed %d)" % (args.n_simulations, args.n_teams, args.seed))
+
+    if args.resume is None:
+        g_folder_name = g_folder_name if DEBUG_MODE  else get_run_folder_name(args)
+        if not DEBUG_MODE:
+            write_run_config(g_folder_name, {key: getattr(args, key) for key in RUN_CONFIG_KEYS})
+
+    args.profile = args.profile or args.cprofile
+    if args.profile:
+        # a forked worker would inherit this cProfile, only a run without a pool runs it here
+        startProfiling(g_folder_name, args.cprofile and DEBUG_MODE)
+
+    if args.trace and MATCH_ENGINE == 2:
+        print("MATCH_ENGINE 2 samples match outcomes without their rounds, no round will be traced")
 
-    g_folder_name = g_folder_name if DEBUG_MODE  else f"./simulations/{datetime.datetime.now().strftime('%Y%m%d_%H-%M-%S')}-{args.n_simulations}s-{args.n_teams}t-{getTournamentFormatStr(args.format).replace(' ', '')}/"
+    # the workers resize their own cache in init_worker
+    getWinProbabilityCache().resize(args.win_cache_size)
 
-    res = run_simulations(args.n_simulations, args.pools)
+    headers = get_result_headers(args.weighting)
+    g_log_listener = None if DEBUG_MODE else startLogListener(g_folder_name)
 
     if DEBUG_MODE: 
-        success_prediction = res 
+        success_prediction = run_simulations(args, g_folder_name)
+    elif args.target_ci is not None:
+        with StreamingResultsWriter(headers, g_folder_name, args.buffer_size, args.checkpoint_every) as writer:
+            if args.replicas > 1 and args.format in REPLICA_FORMATS:
+                statistics = run_until_precise(replica_simulation, get_replica_tasks(args, completed), args, g_folder_name, writer, completed)
+            else:
+                statistics = run_until_precise(simulation_chunk, get_simulation_tasks(args, g_folder_name, completed), args, g_folder_name, writer, completed)
+
+        print("Stopped after %d simulations: mean kendall tau distance %.4f +/- %.4f" % (statistics.getCount(), statistics.getMean(), statistics.getConfidenceHalfWidth()))
     else: 
-        headers = ["simId", "kendalTauDistance", "disagreement", "matchCount", "tieCount", "completeDuplicateMatches"]
-        results_to_csv(res, headers, g_folder_name)
-        
\ No newline at end of file
+        with StreamingResultsWriter(headers, g_folder_name, args.buffer_size, args.checkpoint_every) as writer:
+            if args.replicas > 1 and args.format in REPLICA_FORMATS:
+                run_replica_simulations(args, g_folder_name, writer, completed)
+            else:
+                run_simulations(args, g_folder_name, writer, completed)
+        
+    stopLogListener(g_log_listener)
+
+    if args.columnar and not DEBUG_MODE:
+        csv_to_columns(get_results_path(g_folder_name, "final_results.csv"))
+
+    if not DEBUG_MODE:
+        with RunCatalog() as catalog:
+            catalog.updateFile(get_results_path(g_folder_name, "final_results.csv"))
+
+    if args.profile:
+        getProfiler().save()
+        print(formatProfileTable(mergeProfiles(g_folder_name)))
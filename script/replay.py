@@ -0,0 +1,189 @@
+"""
+Scores the tournaments of a traced run again (main.py --trace) without playing them.
+
+The team counters of every simulation are rebuilt from its recorded rounds (AlaraMatchBatch.resolveMatchBatch on the
+traced round winners) and the ratings are drawn again from the seed saved in run.json, then the final rankings are
+computed with other tiebreak orders and compared to the prediction with the kendall tau distance (and a weighted one).
+Matches are not played again: a Swiss system keeps the pairings made with the tiebreak of the original run.
+
+    python replay.py ./simulations/<run>/ --tiebreak match,cycle,round,defense --tiebreak match,round -w top3
+
+Each tiebreak order is saved as <run>/replay/<order>[-<weighting>].csv, with the columns of final_results.csv.
+The default tiebreak gives back final_results.csv.
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from utils import *
+from Team import computeScores, rankOrderFromScores, SCORE_MATCH_VICTORIES, SCORE_CYCLE_RATE, SCORE_ROUND_RATE, SCORE_DEFENSE_RATE
+from AlaraMatchBatch import resolveMatchBatch
+from RankingComparator import kendall_tau_distance_batch, weighted_kendall_tau_distance_batch, get_weights, WEIGHT_FAMILIES
+from RoundTrace import readRoundTrace, indexRoundTraces
+from ReplicaSimulation import REPLICA_FORMATS
+from csvManager import read_run_config, get_results_path, summarize_csv, read_summary
+from main import simulation_rng, get_result_headers, create_pool
+
+TIEBREAK_COLUMNS = {"match": SCORE_MATCH_VICTORIES, "cycle": SCORE_CYCLE_RATE, "round": SCORE_ROUND_RATE, "defense": SCORE_DEFENSE_RATE}
+DEFAULT_TIEBREAK = "match,cycle,round,defense"
+# simulations scored together by one task
+REPLAY_TASK_SIZE = 256
+
+# trace files opened by this process, by path
+g_trace_files: dict[str, np.ndarray] = {}
+
+
+def parse_tiebreak(tiebreak: str) -> tuple[int, ...]:
+    return tuple(TIEBREAK_COLUMNS[name.strip()] for name in tiebreak.split(","))
+
+
+def replay_field(config: dict, simulation: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rating means of the teams of a simulation and the order of its participants (the order ties keep),
+    drawn again from the generator main.py gave the simulation
+    """
+    n_teams = config["n_teams"]
+    if config["replicas"] > 1 and config["format"] in REPLICA_FORMATS:
+        # replicas are drawn together from the generator of the first simulation of their batch (ReplicaSimulation)
+        start = simulation - simulation % config["replicas"]
+        mus = simulation_rng(config["seed"], start).normal(25, 25 / 3, (simulation - start + 1, n_teams))[-1]
+        return mus, np.arange(n_teams)
+
+    # same draws as main.generate_teams
+    rng = simulation_rng(config["seed"], simulation)
+    mus = rng.normal(25, 25 / 3, n_teams)
+    participants = list(range(n_teams))
+    if config["format"] == 4:
+        # the custom format shuffles its participants before the groups (tournamentCustom.play)
+        rng.shuffle(participants)
+    return mus, np.array(participants)
+
+
+def read_simulation_rounds(ranges: list[tuple[str, int, int]]) -> np.ndarray:
+    for path, _, _ in ranges:
+        if path not in g_trace_files:
+            g_trace_files[path] = readRoundTrace(path)
+    return np.concatenate([g_trace_files[path][start:stop] for path, start, stop in ranges])
+
+
+def replay_counters(simulations: list[int], records: np.ndarray, n_teams: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Counters (S, n, COUNTER_COUNT) of the teams of each simulation, number of matches (S,) and complete duplicate matchups (S,)
+    """
+    simulation_index = np.searchsorted(simulations, records["simulation"])
+    match_keys = simulation_index.astype(np.int64) * (int(records["match"].max()) + 1) + records["match"]
+    _, first_records, match_index = np.unique(match_keys, return_index=True, return_inverse=True)
+
+    # rounds after the end of a match are ignored by resolveMatchBatch, the padding doesn't matter
+    round_winners = np.zeros((len(first_records), MAX_ROUNDS_IN_MATCH), dtype=np.int8)
+    round_winners[match_index, records["round"]] = records["winner"]
+    _, _, counters = resolveMatchBatch(round_winners)
+
+    match_teams = records["teams"][first_records].astype(np.int64)
+    match_simulation = simulation_index[first_records]
+    team_counters = np.zeros((len(simulations) * n_teams, COUNTER_COUNT), dtype=np.int64)
+    np.add.at(team_counters, (match_simulation[:, None] * n_teams + match_teams).ravel(), counters.reshape(-1, COUNTER_COUNT))
+
+    match_counts = np.bincount(match_simulation, minlength=len(simulations))
+    sorted_teams = np.sort(match_teams, axis=1)
+    matchup_keys = ((match_simulation * n_teams + sorted_teams[:, 0]) * n_teams + sorted_teams[:, 1]) * n_teams + sorted_teams[:, 2]
+    distinct_matchups = np.bincount(np.unique(matchup_keys) // n_teams ** 3, minlength=len(simulations))
+    return team_counters.reshape(len(simulations), n_teams, COUNTER_COUNT), match_counts, match_counts - distinct_matchups
+
+
+def replay_task(input: tuple[list[int], list[list[tuple[str, int, int]]], dict, list[tuple[int, ...]], str]) -> list[list[tuple]]:
+    """
+    Scores the simulations input[0] (their trace ranges are input[1]) of a run with settings input[2], once per
+    tiebreak of input[3], weighted with the family input[4] when it isn't None. Returns one list of rows per tiebreak.
+    """
+    simulations, ranges, config, tiebreaks, weighting = input
+    n_teams = config["n_teams"]
+    records = read_simulation_rounds([segment for simulation_ranges in ranges for segment in simulation_ranges])
+    counters, match_counts, duplicates = replay_counters(np.array(simulations), records, n_teams)
+
+    fields = [replay_field(config, simulation) for simulation in simulations]
+    mus = np.array([field[0] for field in fields])
+    participants = np.array([field[1] for field in fields])
+    # sigmas are all equal, the rating ordinal orders teams like their mean (main.predict_result)
+    predicted = np.argsort(-mus, axis=1, kind="stable")
+    scores = np.take_along_axis(computeScores(counters), participants[:, :, None], axis=1)
+    weights = get_weights(weighting, n_teams) if weighting is not None else None
+
+    results = []
+    for tiebreak in tiebreaks:
+        order = rankOrderFromScores(scores, tiebreak)
+        ranking = np.take_along_axis(participants, order, axis=1)
+        tau_distances, disagreements = kendall_tau_distance_batch(predicted, ranking)
+
+        # teams sharing every compared score column with the team ranked before them
+        sorted_scores = np.take_along_axis(scores, order[:, :, None], axis=1)[:, :, list(tiebreak)]
+        tie_counts = np.all(sorted_scores[:, 1:] == sorted_scores[:, :-1], axis=2).sum(axis=1)
+
+        rows = [(str(simulation), float(tau_distances[k]), int(disagreements[k]), int(match_counts[k]), int(tie_counts[k]), int(duplicates[k]))
+                for k, simulation in enumerate(simulations)]
+        if weights is not None:
+            weighted_tau_distances, weighted_disagreements = weighted_kendall_tau_distance_batch(predicted, ranking, weights)
+            rows = [row + (float(weighted_tau_distances[k]), float(weighted_disagreements[k])) for k, row in enumerate(rows)]
+        results.append(rows)
+    return results
+
+
+def get_replay_file_name(tiebreak: str, weighting: str = None) -> str:
+    name = "-".join(name.strip() for name in tiebreak.split(","))
+    return f"{name}-{weighting}.csv" if weighting is not None else f"{name}.csv"
+
+
+def run_replay(folder: str, tiebreaks: list[str], weighting: str, pools: int, task_size: int = REPLAY_TASK_SIZE) -> list[str]:
+    """
+    Scores every traced simulation of the run saved in folder with each tiebreak, returns the replay files written
+    """
+    config = read_run_config(folder)
+    index = indexRoundTraces(folder)
+    simulations = sorted(index)
+    tasks = [(simulations[start:start + task_size], [index[simulation] for simulation in simulations[start:start + task_size]],
+              config, [parse_tiebreak(tiebreak) for tiebreak in tiebreaks], weighting) for start in range(0, len(simulations), task_size)]
+
+    rows: list[list[tuple]] = [[] for _ in tiebreaks]
+    with create_pool(pools) as p:
+        with tqdm(total=len(simulations)) as progress:
+            for results in p.imap_unordered(replay_task, tasks):
+                for tiebreak_rows, task_rows in zip(rows, results):
+                    tiebreak_rows += task_rows
+                progress.update(len(results[0]))
+
+    files = []
+    for tiebreak, tiebreak_rows in zip(tiebreaks, rows):
+        replay_file = get_results_path(folder, "replay/" + get_replay_file_name(tiebreak, weighting))
+        os.makedirs(os.path.dirname(replay_file), exist_ok=True)
+        with open(replay_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(get_result_headers(weighting))
+            writer.writerows(sorted(tiebreak_rows, key=lambda row: int(row[0])))
+        summarize_csv(replay_file)
+        files.append(replay_file)
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', type=str)
+    # score columns compared in order, among match, cycle, round and defense; can be given several times
+    parser.add_argument('--tiebreak', action='append', default=None)
+    parser.add_argument('-w', '--weighting', choices=list(WEIGHT_FAMILIES.keys()), default=None)
+    parser.add_argument('-p', '--pools', type=int, default=4)
+    parser.add_argument('--task-size', type=int, default=REPLAY_TASK_SIZE)
+    replay_args = parser.parse_args()
+
+    folder = replay_args.folder if replay_args.folder.endswith("/") else replay_args.folder + "/"
+    tiebreaks = replay_args.tiebreak or [DEFAULT_TIEBREAK]
+    for tiebreak in tiebreaks:
+        if any(name.strip() not in TIEBREAK_COLUMNS for name in tiebreak.split(",")):
+            parser.error(f"invalid tiebreak {tiebreak}, use score columns among {', '.join(TIEBREAK_COLUMNS)}")
+
+    for tiebreak, replay_file in zip(tiebreaks, run_replay(folder, tiebreaks, replay_args.weighting, replay_args.pools, replay_args.task_size)):
+        summary = read_summary(replay_file)
+        tau = summary["columns"]["kendalTauDistance"]
+        print("%-28s mean kendall tau distance %.4f +/- %.4f (%d simulations)" % (tiebreak, tau["mean"], tau["ci"] or 0, summary["count"]))
@@ -6,6 +6,8 @@ import csv
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 from scipy.stats import norm
+from csvManager import load_result_columns, read_summary
+from RunCatalog import RunCatalog, get_format_file_name
 
 
 # simId,kendalTauDistance,disagreement,matchCount,tieCount,completeDuplicateMatches
@@ -50,21 +52,33 @@ def map_filename_to_color(filename:str):
     return "#{:02x}{:02x}{:02x}".format(r, g, b)
 
 
+def getCatalogedRuns(relative_root_folder_path: str) -> list[dict]:
+    """
+    Result files directly in the folder, from the run catalog (only files changed since the last call are read),
+    each entry also gets the absolute path of its file
+    """
+    with RunCatalog() as catalog:
+        catalog.update(relative_root_folder_path)
+        return [dict(run, file=catalog.getResultFile(run)) for run in catalog.query(folder=relative_root_folder_path, recursive=False)]
+
+def getRunLabel(run: dict) -> str:
+    return f"{get_format_file_name(run['format'])} - {run['n_teams']} teams"
+
+def getRunColor(run: dict) -> str:
+    return map_filename_to_color(f"{run['n_teams']:02d}t-{get_format_file_name(run['format'])}")
+
+
 def drawBoxplotFromFilesInFolderForColumn(relative_root_folder_path: str, colName: str):
-    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_root_folder_path))
     name_list = []
     data_list = []
     color_list = []
     this_plot = plt
 
-    for filename in os.listdir(root):
-        if filename.endswith('.csv'): # if csv file then we process it
-            path = relative_root_folder_path + filename
-            parts = filename.split("-")
-            data = pd.read_csv(path)[colName]
-            name_list.append(f"{parts[1][:-4]} - {parts[0][:-1]} teams")
-            data_list.append(list(data))
-            color_list.append(map_filename_to_color(filename[:-4]))
+    for run in getCatalogedRuns(relative_root_folder_path):
+        data = load_result_columns(run["file"], [colName])[colName]
+        name_list.append(getRunLabel(run))
+        data_list.append(list(data))
+        color_list.append(getRunColor(run))
 
     this_plot.title("KTRC measures per format and size")
 
@@ -137,24 +151,26 @@ def cumulativeAverageForCustom():
 
 
 def cumulativeAverageForAllFile(relative_root_folder_path: str, colName: str):
-    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_root_folder_path))
     this_plot = plt
 
-    # iterate through all files in folder
-    for filename in os.listdir(root):
-        if filename.endswith('.csv'): # if csv file then we process it
-            path = relative_root_folder_path + filename
-            dataframe = pd.read_csv(path)[colName]
-            avgs: list[float] = []
-            sum = 0
+    # iterate through all result files in folder
+    for run in getCatalogedRuns(relative_root_folder_path):
+        summary = read_summary(run["file"])
+        if summary is not None and colName in summary["columns"]:
+            # log-spaced points of the curve saved during the simulation, no need to read the results
+            counts, avgs = zip(*summary["columns"][colName]["cumulativeMeans"])
+            this_plot.plot(np.array(counts) - 1, avgs, label=getRunLabel(run), color=getRunColor(run))
+            continue
 
-            parts = filename.split("-")
+        dataframe = load_result_columns(run["file"], [colName])[colName]
+        avgs: list[float] = []
+        sum = 0
 
-            for data in dataframe: # compute the cumulative average for file
-                sum += data
-                avgs.append(sum / (len(avgs)+1))
+        for data in dataframe: # compute the cumulative average for file
+            sum += data
+            avgs.append(sum / (len(avgs)+1))
 
-            this_plot.plot(avgs, label=f"{parts[1][:-4]} - {parts[0][:-1]} teams", color=map_filename_to_color(filename[:-4]))
+        this_plot.plot(avgs, label=getRunLabel(run), color=getRunColor(run))
         
 
     # Get the handles and labels for the plot
@@ -169,40 +185,37 @@ def cumulativeAverageForAllFile(relative_root_folder_path: str, colName: str):
     return this_plot.show()
 
 def printStuffForAllFile(relative_root_folder_path: str, colName: str):
-    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_root_folder_path))
-
     average_list = []
     std_dev_list = []
     confidence_interval_list = []
     print("file,colName,avg,sd,cilowerbound,ciupperbound,matchcount")
-    # iterate through all files in folder
-    for filename in os.listdir(root):
-        if filename.endswith('.csv'): # if csv file then we process it
-            path = relative_root_folder_path + filename
-            dataframe = pd.read_csv(path)
+    # iterate through all result files in folder
+    for run in getCatalogedRuns(relative_root_folder_path):
+        filename = os.path.basename(run["file"])
+        matchCnt = run["match_count"]
 
-            # Calculate statistics
-            average = dataframe[colName].mean()
-            std_dev = dataframe[colName].std()
-            matchCnt = dataframe["matchCount"]
-            confidence_interval_width = 1.96 * std_dev / np.sqrt(len(dataframe))  # Assuming 95% confidence interval
+        # the catalog already holds the statistics of the kendall tau distance
+        if colName == "kendalTauDistance":
+            average, std_dev, confidence_interval_width = run["tau_mean"], run["tau_std"], run["tau_ci"]
+        else:
+            column = load_result_columns(run["file"], [colName])[colName]
+            average = column.mean()
+            std_dev = column.std(ddof=1)
+            confidence_interval_width = 1.96 * std_dev / np.sqrt(len(column))  # Assuming 95% confidence interval
 
-            lower_bound, upoper_bound = (average - confidence_interval_width, average+confidence_interval_width)
+        lower_bound, upoper_bound = (average - confidence_interval_width, average+confidence_interval_width)
 
 
-            average_list.append(average)
-            std_dev_list.append(std_dev)
-            confidence_interval_list.append(confidence_interval_width)
+        average_list.append(average)
+        std_dev_list.append(std_dev)
+        confidence_interval_list.append(confidence_interval_width)
 
-            parts = filename.split("-")
-
-            print(f"{filename[:-4]},{colName},{average},{std_dev},{lower_bound},{upoper_bound},{matchCnt[0]}")
+        print(f"{filename[:-4]},{colName},{average},{std_dev},{lower_bound},{upoper_bound},{matchCnt:g}")
 
 
 
 def get_sk_winner_check_stat(): 
     relative_root_folder_path = "simulations/SingleKnockoutExperiment/"
-    root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_root_folder_path))
     this_plot = plt
 
     average_list = []
@@ -210,25 +223,21 @@ def get_sk_winner_check_stat():
     confidence_interval_list = []
     name_list = []
     print("format,teamCount,ktrcavg,ktrcsd,cilowerbound,ciupperbound,matchcount")
-    # iterate through all files in folder
-    for filename in os.listdir(root):
-        if filename.endswith('.csv'): # if csv file then we process it
-            path = relative_root_folder_path + filename
-            dataframe = pd.read_csv(path)["kendalTauDistance"]
-
-            # Calculate statistics
-            average = dataframe.mean()
-            std_dev = dataframe.std()
-            confidence_interval_width = 1.96 * std_dev / np.sqrt(len(dataframe))  # Assuming 95% confidence interval
+    # iterate through all result files in folder
+    for run in getCatalogedRuns(relative_root_folder_path):
+        # Statistics from the catalog
+        average = run["tau_mean"]
+        std_dev = run["tau_std"]
+        confidence_interval_width = run["tau_ci"]  # Assuming 95% confidence interval
 
-            lower_bound, upoper_bound = (average - confidence_interval_width, average+confidence_interval_width)
+        lower_bound, upoper_bound = (average - confidence_interval_width, average+confidence_interval_width)
 
 
-            average_list.append(average)
-            std_dev_list.append(std_dev)
-            confidence_interval_list.append(confidence_interval_width)
+        average_list.append(average)
+        std_dev_list.append(std_dev)
+        confidence_interval_list.append(confidence_interval_width)
 
-            print(f"{filename} - {average*100}")
+        print(f"{os.path.basename(run['file'])} - {average*100}")
 
 def get_rr_stat(): 
     relative_root_folder_path = "simulations/Roundrobin_obs/result.csv"
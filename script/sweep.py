@@ -0,0 +1,171 @@
+"""
+Runs a whole grid of experiments (formats x team counts x Swiss rounds) on one pool of workers.
+
+The grid is a json file, every list is crossed with the others and the Swiss round counts only apply to the Swiss system:
+{
+    "n_simulations": 10000,
+    "seed": 1,
+    "formats": [1, 2, 3, 4],
+    "teams": [9, 27, 81, 243],
+    "rounds": [8],
+    "replicas": 1,
+    "weighting": null
+}
+
+Each configuration is saved in its own folder of the sweep folder, with the layout of main.py (final_results.csv,
+run.json, checkpoint.json) so it can be resumed alone with main.py --resume. Running the sweep again on the same
+output folder only plays the missing simulations. At the end, the results are also copied as <teams>t-<Format>.csv
+in the sweep folder, the layout read by statistic_plot_script.py (in a <rounds>rounds/ subfolder for the Swiss
+system when several round counts are swept).
+"""
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+
+from tqdm import tqdm
+
+from utils import *
+from csvManager import StreamingResultsWriter, read_completed_indices, write_run_config, get_results_path, summarize_csv
+from ReplicaSimulation import REPLICA_FORMATS
+from RunCatalog import RunCatalog, get_format_file_name
+from main import single_simulation, replica_simulation, simulation_rng, estimate_match_count, get_result_headers, get_run_folder_name, create_pool, RUN_CONFIG_KEYS
+from Logger import startLogListener, stopLogListener
+
+# simulations of a task are grouped so each task plays about this many matches, whatever the configuration
+SWEEP_TASK_MATCHES = 2048
+# upper bound of simulations in one task, keeps the progress bar and the checkpoints moving for tiny tournaments
+SWEEP_MAX_TASK_SIZE = 256
+
+
+def load_grid(path: str) -> list[argparse.Namespace]:
+    with open(path) as file:
+        grid = json.load(file)
+
+    configs = []
+    for format, n_teams in itertools.product(grid["formats"], grid["teams"]):
+        for rounds in (grid.get("rounds", [SWISS_ROUNDS]) if format == 3 else [SWISS_ROUNDS]):
+            configs.append(argparse.Namespace(
+                n_simulations=grid["n_simulations"], n_teams=n_teams, format=format, rounds=rounds,
+                seed=grid.get("seed", 0), replicas=grid.get("replicas", 1), weighting=grid.get("weighting"),
+                target_ci=None, min_simulations=0
+            ))
+    return configs
+
+
+def is_valid_config(config: argparse.Namespace) -> bool:
+    match config.format:
+        case 1: return is_power_of(config.n_teams, TEAMS_IN_ONE_MATCH)
+        case 2: return config.n_teams >= TEAMS_IN_ONE_MATCH
+        case 3: return config.n_teams % TEAMS_IN_ONE_MATCH == 0
+        case 4: return config.n_teams >= 9 and config.n_teams % TEAMS_IN_ONE_MATCH == 0
+    return False
+
+
+def uses_replicas(config: argparse.Namespace) -> bool:
+    return config.replicas > 1 and config.format in REPLICA_FORMATS
+
+
+def make_tasks(configs: list[argparse.Namespace], completed: list[set[int]]) -> list[tuple[int, list[int]]]:
+    """
+    (config index, simulation indices) tasks of about SWEEP_TASK_MATCHES matches each.
+    Tasks are ordered by how far they are in their configuration, so every configuration progresses at the same pace
+    and the small ones are spread between the large ones instead of all running at the start or the end.
+    """
+    tasks = []
+    for c, config in enumerate(configs):
+        if uses_replicas(config):
+            # a replica batch is played with the seed of its first simulation, batches must stay aligned
+            chunks = [list(range(start, min(start + config.replicas, config.n_simulations))) for start in range(0, config.n_simulations, config.replicas)]
+            chunks = [chunk for chunk in chunks if any(i not in completed[c] for i in chunk)]
+        else:
+            task_size = int(min(SWEEP_MAX_TASK_SIZE, max(1, SWEEP_TASK_MATCHES // estimate_match_count(config))))
+            missing = [i for i in range(config.n_simulations) if i not in completed[c]]
+            chunks = [missing[start:start + task_size] for start in range(0, len(missing), task_size)]
+
+        for k, chunk in enumerate(chunks):
+            tasks.append(((k + 0.5) / len(chunks), -estimate_match_count(config), c, chunk))
+
+    tasks.sort(key=lambda task: task[:2])
+    return [(c, chunk) for _, _, c, chunk in tasks]
+
+
+def sweep_task(input: tuple[int, argparse.Namespace, str, list[int]]) -> tuple[int, list[tuple]]:
+    config_index, config, folder, indices = input
+    if uses_replicas(config):
+        return config_index, replica_simulation((indices[0], len(indices), config))
+    return config_index, [single_simulation((i, simulation_rng(config.seed, i), folder, config)) for i in indices]
+
+
+def export_for_plots(configs: list[argparse.Namespace], folders: list[str], output_folder: str):
+    """
+    Copies the results of every configuration as <teams>t-<Format>.csv, rows ordered by simulation index, with their summary
+    """
+    swept_rounds = {config.rounds for config in configs if config.format == 3}
+
+    for config, folder in zip(configs, folders):
+        with open(get_results_path(folder, "final_results.csv"), newline='') as file:
+            rows = list(csv.reader(file))
+        rows[1:] = sorted(rows[1:], key=lambda row: int(row[0]))
+
+        plot_folder = output_folder
+        if config.format == 3 and len(swept_rounds) > 1:
+            plot_folder += f"{config.rounds}rounds/"
+        plot_file = get_results_path(plot_folder, f"{config.n_teams}t-{get_format_file_name(config.format)}.csv")
+        os.makedirs(os.path.dirname(plot_file), exist_ok=True)
+        with open(plot_file, 'w', newline='') as file:
+            csv.writer(file).writerows(rows)
+        summarize_csv(plot_file)
+
+
+def run_sweep(configs: list[argparse.Namespace], pools: int, output_folder: str, buffer_size: int, checkpoint_every: int):
+    folders = [get_run_folder_name(config, output_folder, timestamped=False) for config in configs]
+    for config, folder in zip(configs, folders):
+        write_run_config(folder, {key: getattr(config, key) for key in RUN_CONFIG_KEYS})
+    completed = [read_completed_indices(folder) for folder in folders]
+    tasks = [(c, configs[c], folders[c], chunk) for c, chunk in make_tasks(configs, completed)]
+
+    log_listener = startLogListener(output_folder)
+    writers = [StreamingResultsWriter(get_result_headers(config.weighting), folder, buffer_size, checkpoint_every) for config, folder in zip(configs, folders)]
+    try:
+        with create_pool(pools, log_listener) as p:
+            with tqdm(total=sum(config.n_simulations - len(done) for config, done in zip(configs, completed))) as progress:
+                for config_index, results in p.imap_unordered(sweep_task, tasks):
+                    results = [(index, row) for index, row in results if index not in completed[config_index]]
+                    for index, row in results:
+                        writers[config_index].write(index, row)
+                    progress.update(len(results))
+    finally:
+        for writer in writers:
+            writer.close()
+        stopLogListener(log_listener)
+
+    export_for_plots(configs, folders, output_folder)
+    with RunCatalog() as catalog:
+        catalog.update(output_folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('grid', type=str)
+    parser.add_argument('-p', '--pools', type=int, default=4)
+    # folder of a previous sweep to complete, a new timestamped folder by default
+    parser.add_argument('-o', '--output', type=str, default=None)
+    parser.add_argument('--buffer-size', type=int, default=100)
+    parser.add_argument('--checkpoint-every', type=int, default=1000)
+    sweep_args = parser.parse_args()
+
+    configs = []
+    for config in load_grid(sweep_args.grid):
+        if is_valid_config(config):
+            configs.append(config)
+        else:
+            print(f"Skipping {config.n_teams} teams in {getTournamentFormatStr(config.format)}: invalid team count for this format")
+
+    output_folder = sweep_args.output or f"./simulations/{datetime.datetime.now().strftime('%Y%m%d_%H-%M-%S')}-sweep/"
+    output_folder = output_folder if output_folder.endswith("/") else output_folder + "/"
+
+    print("Running %2d configurations (%d simulations) in %s" % (len(configs), sum(config.n_simulations for config in configs), output_folder))
+    run_sweep(configs, sweep_args.pools, output_folder, sweep_args.buffer_size, sweep_args.checkpoint_every)
@@ -1,11 +1,15 @@
 import abc
-import math
-from Team import Team
+from Team import Team, rankTeams
 from utils import *
 import numpy as np
 from AlaraMatch import AlaraMatch
+from AlaraMatchBatch import AlaraMatchBatch
+from FieldWinProbabilities import FieldWinProbabilities
+from SwissPairing import SwissPairingEngine
 from Logger import Logger
+from PhaseProfiler import profiledPhase
 from itertools import combinations
+from collections import Counter
 
 class aTournament(abc.ABC):
     _participants: list[Team]
@@ -13,6 +17,8 @@ class aTournament(abc.ABC):
     _rng: np.random.Generator
     _logger: Logger
     _matchupHistory: list[tuple[Team, Team, Team]]
+    _matchupCounts: Counter
+    _duplicateMatchupCount: int
 
     @abc.abstractmethod
     def __init__(self, participants: list[Team], rng: np.random.Generator, logger: Logger):
@@ -20,8 +26,40 @@ class aTournament(abc.ABC):
         self._rng = rng
         self._logger = logger
         self._matchupHistory = []
+        # matchups are counted on sorted team id triples as they are played
+        self._matchupCounts = Counter()
+        self._duplicateMatchupCount = 0
+        self._sharedTable = self._getSharedTable(participants)
         pass
 
+    @staticmethod
+    def _getSharedTable(participants: list[Team]):
+        table = participants[0].get_table() if len(participants) > 0 else None
+        return table if all(team.get_table() is table for team in participants) else None
+
+    def _getMatchupKey(self, matchup: tuple[Team, Team, Team]) -> tuple:
+        # team ids identify teams inside a TeamTable, teams from different tables fall back on object identity
+        if self._sharedTable is not None:
+            return tuple(sorted(team.get_id() for team in matchup))
+        return tuple(sorted(id(team) for team in matchup))
+
+    def _recordMatchup(self, matchup: tuple[Team, Team, Team]):
+        self._matchupHistory.append(set(matchup))
+        key = self._getMatchupKey(matchup)
+        if key in self._matchupCounts:
+            self._duplicateMatchupCount += 1
+        self._matchupCounts[key] += 1
+
+    def _absorbMatchups(self, phase: "aTournament"):
+        """
+        Adds the matchups played in a phase (a group or the final stage of a custom tournament) to this tournament
+        """
+        self._matchupHistory += phase._matchupHistory
+        for key, count in phase._matchupCounts.items():
+            # every occurrence is a duplicate once the matchup is already known, the first one isn't otherwise
+            self._duplicateMatchupCount += count if key in self._matchupCounts else count - 1
+            self._matchupCounts[key] += count
+
     @abc.abstractmethod
     def play(self):
         pass
@@ -31,46 +69,53 @@ class aTournament(abc.ABC):
         pass
 
     def getMatchCount(self):
-        self._logger.logInfoMessage(f"Match played in tournament: {len(self._matchupHistory)}")
+        self._logger.logInfoMessage("Match played in tournament: %d", len(self._matchupHistory))
         return len(self._matchupHistory)
     
     def getTieCount(self):
-        ties = 0
-        tiedScores: list[tuple[int, int, int, int]] = []
-        for i in range(len(self._participants)):
-            reference_score = self._participants[i].get_score()
-
-            if reference_score in tiedScores :
-                continue
-
-            for j in range(i+1, len(self._participants)):
-                compared_score = self._participants[j].get_score()
-                if reference_score == compared_score:
-                    ties += 1
-
-            tiedScores.append(reference_score)
+        # every team sharing its score with a team listed before it is a tie: n - number of distinct scores
+        if self._sharedTable is not None:
+            scores = self._sharedTable.getScores([team.get_id() for team in self._participants])
+            distinct_scores = len(np.unique(scores, axis=0))
+        else:
+            distinct_scores = len(set(team.get_score() for team in self._participants))
+        ties = len(self._participants) - distinct_scores
 
-        self._logger.logInfoMessage(f"Ties in tournament: {ties}")
+        self._logger.logInfoMessage("Ties in tournament: %d", ties)
         return ties
 
+    @profiledPhase("play_match")
     def playTournamentMatch(self, matchup: tuple[Team, Team, Team]) -> Team:
-        self._matchupHistory.append(set(matchup))
+        self._recordMatchup(matchup)
         return AlaraMatch(matchup, self._rng, self._logger).playMatch()
+
+    @profiledPhase("play_match")
+    def playTournamentMatches(self, matchups: list[tuple[Team, Team, Team]], win_probabilities: np.ndarray = None) -> list[Team]:
+        """
+        Plays matchups that don't depend on each other's results and returns their winners.
+        With the batched engine, all of them are simulated at once, from their round odds win_probabilities (m, 3) when given.
+        """
+        if MATCH_ENGINE == 0:
+            return [self.playTournamentMatch(matchup) for matchup in matchups]
+
+        for matchup in matchups:
+            self._recordMatchup(matchup)
+
+        self._logger.logInfoMessage("PLAYING %d MATCHES IN BATCH --------------------------------------------------", len(matchups))
+        AlaraMatch.matchNumber += len(matchups)
+        return AlaraMatchBatch(matchups, self._rng, win_probabilities).playMatches()
     
     def getCompleteDuplicateMatchupCount(self)-> int:
-        # sorting the tuple so ABC and BAC are found as a duplicate
-        sorted_history_matchup = map(lambda matchup: tuple(sorted(matchup, key = lambda t: t.get_score())), self._matchupHistory)
-
-        set_matchup = set(sorted_history_matchup)
-        res = len(self._matchupHistory) - len(set_matchup)
-        self._logger.logInfoMessage(f"Duplicate matches in tournament: {res}")
+        # counted as matchups are recorded: ABC and BAC share the same sorted id triple
+        res = self._duplicateMatchupCount
+        self._logger.logInfoMessage("Duplicate matches in tournament: %d", res)
         return res
 
 # ======================================================================================
 
 class TournamentSingleKnockout(aTournament):
     def __init__(self, participants: list[Team], rng: np.random.Generator, logger: Logger):
-        if(is_integer(math.log(len(participants), TEAMS_IN_ONE_MATCH))):
+        if is_power_of(len(participants), TEAMS_IN_ONE_MATCH):
             super().__init__(participants, rng, logger)
         else:
             raise Exception("Single knockout needs for base participants unfulfilled (need power of 3)")
@@ -81,7 +126,7 @@ class TournamentSingleKnockout(aTournament):
         return [(self._participants[i], self._participants[i+1], self._participants[i+2]) for i in range(0, len(self._participants), TEAMS_IN_ONE_MATCH)]
     
     def getFinalRanking(self):
-        self._ranking = sorted(self._participants.copy(), key = lambda t: t.get_score(), reverse=True)
+        self._ranking = rankTeams(self._participants)
         return self._ranking
 
     def play(self):
@@ -89,15 +134,8 @@ class TournamentSingleKnockout(aTournament):
 
         # while we're not in the final, resolve matches into new brackets
         while len(brackets) > 1:
-            new_brackets = []
-            for i in range(0, len(brackets), 3):
-                new_bracket = (
-                    self.playTournamentMatch(brackets[i]),
-                    self.playTournamentMatch(brackets[i+1]),
-                    self.playTournamentMatch(brackets[i+2])
-                    )
-                new_brackets.append(new_bracket)
-            brackets = new_brackets
+            winners = self.playTournamentMatches(brackets)
+            brackets = [tuple(winners[i:i+TEAMS_IN_ONE_MATCH]) for i in range(0, len(winners), TEAMS_IN_ONE_MATCH)]
         
         # Resolve the final
         self.playTournamentMatch(brackets[0])
@@ -111,14 +149,15 @@ class tournamentRoundRobin(aTournament):
         super().__init__(participants, rng, logger)
 
     def getFinalRanking(self):
-        self._ranking = sorted(self._participants.copy(), key = lambda t: t.get_score(), reverse=True)
+        self._ranking = rankTeams(self._participants)
         return self._ranking
 
     def play(self):
-        all_matches= combinations(self._participants, TEAMS_IN_ONE_MATCH)
-        
-        for matchup in all_matches:
-            self.playTournamentMatch(matchup)
+        all_matches= list(combinations(self._participants, TEAMS_IN_ONE_MATCH))
+
+        # the odds of every triple in one vectorized pass, in the same order as all_matches
+        odds = FieldWinProbabilities.fromTeams(self._participants).getRoundWinProbabilities() if MATCH_ENGINE != 0 else None
+        self.playTournamentMatches(all_matches, odds)
         
         return self.getFinalRanking()
 
@@ -126,61 +165,48 @@ class tournamentRoundRobin(aTournament):
 
 class tournamentSwissSystem(aTournament):
     _rounds = 5
+    _pairingEngine: SwissPairingEngine
+    _localIds: dict[Team, int]
 
     def __init__(self, participants: list[Team], rng: np.random.Generator, logger: Logger, rounds: int):
         if len(participants) % TEAMS_IN_ONE_MATCH == 0:
             super().__init__(participants, rng, logger)
             self._rounds = rounds
+            # the pairing engine works on ids local to this tournament (a group of a custom tournament is a subset of the field)
+            self._localIds = {team: i for i, team in enumerate(participants)}
+            self._pairingEngine = SwissPairingEngine(len(participants))
         else:
             raise Exception("Swiss System needs for base participants unfulfilled (need multiple of 3)")
 
     def getFinalRanking(self):
-        self._ranking = sorted(self._participants.copy(), key = lambda t: t.get_score(), reverse=True)
+        self._ranking = rankTeams(self._participants)
         return self._ranking
 
     def play(self):
 
         #first round: 
         self._logger.logInfoMessage("--------------------- ROUND 1")
-        for i in range(0, len(self._participants), TEAMS_IN_ONE_MATCH):
-                self.playTournamentMatch(tuple(self._participants[i:i+TEAMS_IN_ONE_MATCH]))
+        self._playRound([tuple(self._participants[i:i+TEAMS_IN_ONE_MATCH]) for i in range(0, len(self._participants), TEAMS_IN_ONE_MATCH)])
 
         for r in range(self._rounds-1):
-            self._logger.logInfoMessage(f"--------------------- ROUND {r+2}")
+            self._logger.logInfoMessage("--------------------- ROUND %d", r+2)
             round_matchup = self.makeRound()
-            for matchup in round_matchup: 
-                self.playTournamentMatch(matchup)
+            self._playRound(round_matchup)
         return self.getFinalRanking()
+
+    def _playRound(self, round_matchups: list[tuple[Team, Team, Team]]):
+        self.playTournamentMatches(round_matchups)
+        for matchup in round_matchups:
+            self._pairingEngine.recordMatchup(tuple(self._localIds[team] for team in matchup))
     
-    def makeRound(self)->tuple[Team, Team, Team]:
-        participant_pool_ordered = sorted(self._participants.copy(), key = lambda t: t.get_score(), reverse=True)
-        sorted_history_matchup = map(lambda matchup: tuple(sorted(matchup, key = lambda t: t.get_name())), self._matchupHistory)
-        set_past_matchups = set(sorted_history_matchup)
-        round_matchups = []
-        MAX_ATTEMPT = 3
-
-        while len(participant_pool_ordered) >= 3:
-            first_participant = participant_pool_ordered.pop()
-            second_participant = participant_pool_ordered.pop()
-            last_participant = None
-            
-            attempt = 0
-
-            while attempt < min(MAX_ATTEMPT, len(participant_pool_ordered)):
-                ordered_matchup = tuple(sorted((first_participant, second_participant, participant_pool_ordered[attempt]), key = lambda t: t.get_name()))
-                if ordered_matchup not in set_past_matchups:
-                    last_participant = participant_pool_ordered[attempt]
-                    break
-                else:
-                    attempt += 1
-
-            if last_participant is None:
-                last_participant = participant_pool_ordered[0]
-
-            participant_pool_ordered.remove(last_participant)
-            round_matchups.append((first_participant, second_participant, last_participant))
-
-        return round_matchups
+    @profiledPhase("pairing")
+    def makeRound(self)->list[tuple[Team, Team, Team]]:
+        """
+        Groups teams of the same score level together, avoiding teams that already met (see SwissPairingEngine)
+        """
+        ranked_ids = [self._localIds[team] for team in rankTeams(self._participants)]
+        round_matchups = self._pairingEngine.pairRound(ranked_ids)
+        return [tuple(self._participants[i] for i in matchup) for matchup in round_matchups]
 
 # ======================================================================================
 
@@ -193,7 +219,7 @@ class tournamentCustom(aTournament):
             raise Exception("Not enough participants to run the custom tournament format")
 
     def getFinalRanking(self):
-        self._ranking = sorted(self._participants.copy(), key = lambda t: t.get_score(), reverse=True)
+        self._ranking = rankTeams(self._participants)
         return self._ranking
 
     def play(self):
@@ -215,7 +241,7 @@ class tournamentCustom(aTournament):
                 groupPhase = tournamentRoundRobin(group, self._rng, self._logger)
 
             groupPhase.play()
-            self._matchupHistory += groupPhase._matchupHistory
+            self._absorbMatchups(groupPhase)
 
         # step 3 => match the top 3 players of each group against players of other groups to avoid duplicate matches
         finalPhasePlayers = self.seedFinalPhase(groups)
@@ -223,12 +249,13 @@ class tournamentCustom(aTournament):
         # step 4 => play single knockout tournament
         finalPhase = TournamentSingleKnockout(finalPhasePlayers, self._rng, self._logger)
         finalPhase.play()
-        self._matchupHistory += finalPhase._matchupHistory
+        self._absorbMatchups(finalPhase)
 
         # step 5 => final ranking
         return self.getFinalRanking()
 
 
+    @profiledPhase("pairing")
     def seedFinalPhase(self, groups: list[list[Team]]) -> list[Team]:
         n = len(groups)
         result = []
@@ -3,6 +3,25 @@ DEBUG_MODE = 0
 SAVE_LOGS = 0
 DISPLAY_LOGS = 0
 PERFORM_SEED = 0 # could be nice to implement
+WIN_PROBABILITY_CACHE_SIZE = 65536 # matchup odds kept per process by WinProbability, 0 disables the cache
+MATCH_ENGINE = 1 # 0-round by round (AlaraMatch), 1-batched (AlaraMatchBatch), 2-exact model sampling (AlaraMatchModel)
+SWISS_ROUNDS = 8 # rounds of a Swiss system run when none are given (main.py --rounds)
+
+MAX_CYCLE_SCORE = 2
+MAX_MATCH_SCORE = 2
+# a cycle lasts at most 4 rounds (1/1/1 then a second win) and a match at most 4 cycles
+MAX_ROUNDS_IN_MATCH = 16
+
+# column of each statistic in a team counter row (see Team.addCounters)
+MATCH_VICTORY_COUNTER = 0
+CYCLE_VICTORY_COUNTER = 1
+ROUND_VICTORY_COUNTER = 2
+DEFENSE_VICTORY_COUNTER = 3
+MATCH_COUNTER = 4
+CYCLE_COUNTER = 5
+ROUND_COUNTER = 6
+DEFENSE_COUNTER = 7
+COUNTER_COUNT = 8
 
 def is_integer(x) -> bool:
     """
@@ -10,6 +29,14 @@ def is_integer(x) -> bool:
     """
     return x % 1 == 0
 
+def is_power_of(x: int, base: int) -> bool:
+    """
+    Checks if x is base^k for some integer k >= 0, without going through floating point logarithms.
+    """
+    while x > 1 and x % base == 0:
+        x //= base
+    return x == 1
+
 def getTournamentFormatStr(format) -> str:
     match format:
         case 1: return "Single Knockout"